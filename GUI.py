@@ -1,19 +1,16 @@
-import json
+import queue
+import threading
 import tkinter as tk
-import networkx as nx
+import numpy as np
 import customtkinter as ctk
-import matplotlib.pyplot as plt
 
 from timeit import default_timer as timer
 from tkinter import filedialog
-from networkx.algorithms import isomorphism
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
-from algos.vf2 import vf2_isomorphism
-from algos.bliss import bliss_isomorphism
-from algos.color_refinement import color_refinement_isomorphism
-from algos.weisfeiler_lehman import weisfeiler_lehman_isomorphism
-from algos.laszlo_babai_simplified import laszlo_babai_simplified_isomorphism
+from algos.binary_graph import load_graph
+from algos.instrument import recording
+from algos.preview import MAX_PREVIEW_EDGES, MAX_PREVIEW_NODES, graph_preview
+from algos.progress import CancelToken, Cancelled, progress_callback
 
 
 ctk.set_appearance_mode("light")
@@ -27,6 +24,45 @@ except:
     pass
 
 
+# Names of algos.checkers.CHECKERS; the checkers are imported by the first
+# check and matplotlib by the first preview, so the window opens sooner
+ALGORITHMS = {
+    "VF2": "vf2",
+    "Color Refinement": "color_refinement",
+    "Weisfeiler-Lehman": "weisfeiler_lehman",
+    "Bliss": "bliss",
+    "Laszlo-Babai": "laszlo_babai",
+}
+
+PROGRESS_NAMES = {
+    "characters read": "Прочитано символов",
+    "refinement round": "Раунд уточнения",
+    "search nodes": "Узлов поиска",
+}
+
+PROFILE_NAMES = {
+    "load": "Загрузка",
+    "invariants": "Инварианты",
+    "refinement round": "Раунд уточнения",
+    "search": "Поиск",
+    "verify": "Проверка отображения",
+    "search nodes": "Узлов поиска",
+    "pruned branches": "Отсечённых ветвей",
+    "partition cells": "Классов разбиения по раундам",
+    "equitable refinement rounds": "Раундов уточнения при поиске",
+    "automorphisms": "Найдено автоморфизмов",
+    "cache hits": "Попаданий в кэш",
+    "cache misses": "Промахов кэша",
+}
+
+GRAPH_FILETYPES = [("Graph files", "*.json *.isog"), ("JSON files", "*.json"), ("Binary graph files", "*.isog")]
+
+POLL_INTERVAL_MS = 100
+
+# Previews with more nodes than this are drawn without labels
+MAX_LABELLED_NODES = 60
+
+
 class LogColors:
     SUCCESS = "#28a745"
     MESSAGE = "#ffc107"
@@ -39,23 +75,41 @@ class GraphDisplay:
     def __init__(self, master):
         self.master = master
     
-    def display_graph(self, graph, frame, max_nodes=100, max_edges=200):
+    @staticmethod
+    def compute_layout(graph, max_nodes=MAX_PREVIEW_NODES, max_edges=MAX_PREVIEW_EDGES):
+        # Runs off the Tk thread; big graphs become a quotient or a sample
+        return graph_preview(graph, max_nodes=max_nodes, max_edges=max_edges)
+
+    def display_graph(self, graph, frame, max_nodes=MAX_PREVIEW_NODES, max_edges=MAX_PREVIEW_EDGES, layout=None):
         for widget in frame.winfo_children():
             widget.destroy()
-        
-        num_nodes = len(graph.nodes())
-        num_edges = len(graph.edges())
-        
-        if num_nodes > max_nodes or num_edges > max_edges:
-            label = tk.Label(frame, text="Граф слишком объемный для его отображения.")
-            label.grid(row=1, column=0, sticky="nsew")
-        else:
-            fig, ax = plt.subplots(figsize=(5.5, 5.5))
-            pos = nx.spring_layout(graph)
-            nx.draw(graph, pos, with_labels=True, labels=nx.get_node_attributes(graph, 'label'), ax=ax)
-            canvas = FigureCanvasTkAgg(fig, master=frame)
-            canvas.draw()
-            canvas.get_tk_widget().grid(row=0, column=0, sticky="nsew")
+
+        import matplotlib.pyplot as plt
+        from matplotlib.collections import LineCollection
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        preview = layout if layout is not None else GraphDisplay.compute_layout(graph, max_nodes, max_edges)
+        fig, ax = plt.subplots(figsize=(5.5, 5.5))
+        ax.set_axis_off()
+        # One LineCollection and one scatter instead of an artist per edge
+        widths = 0.5 + 2.0 * preview.edge_weights / max(preview.edge_weights.max(initial=0), 1e-9)
+        ax.add_collection(LineCollection(preview.segments(), linewidths=widths, colors="#7f7f7f", zorder=1))
+        sizes = 300 * np.sqrt(preview.node_weights / preview.node_weights.max(initial=1))
+        ax.scatter(preview.positions[:, 0], preview.positions[:, 1], s=sizes, c="#1f78b4", zorder=2)
+        if len(preview.labels) <= MAX_LABELLED_NODES:
+            for (x, y), label in zip(preview.positions.tolist(), preview.labels):
+                ax.annotate(label, (x, y), ha="center", va="center", fontsize=8, zorder=3)
+        if preview.kind == "quotient":
+            ax.set_title(f"Фактор-граф: {len(preview.positions)} классов цвета "
+                         f"({preview.num_nodes} узлов, {preview.num_edges} рёбер)", fontsize=9)
+        elif preview.kind == "sample":
+            ax.set_title(f"Окрестность: {len(preview.positions)} из {preview.num_nodes} узлов "
+                         f"({preview.num_edges} рёбер)", fontsize=9)
+        ax.autoscale_view()
+        canvas = FigureCanvasTkAgg(fig, master=frame)
+        canvas.draw()
+        canvas.get_tk_widget().grid(row=0, column=0, sticky="nsew")
+        plt.close(fig)
 
 
 class GraphIsomorphismCheckerApp(ctk.CTk):
@@ -69,7 +123,7 @@ class GraphIsomorphismCheckerApp(ctk.CTk):
         self.after_callbacks = []
         graph_frame_width = graph_frame_height = 550
         controls_width = 250
-        log_height = 360
+        log_height = 270
 
         # Configure grid layout
         self.grid_columnconfigure(1, weight=1)
@@ -101,15 +155,19 @@ class GraphIsomorphismCheckerApp(ctk.CTk):
         self.button_load1.grid(row=0, column=0, padx=(10,10), pady=(10,10), sticky="nsew")
         self.button_load2 = ctk.CTkButton(self.frame_controls, width=controls_width, text="Загрузить 2 схему (JSON)", command=self.load_graph2)
         self.button_load2.grid(row=1, column=0, padx=(10,10), pady=(0,10), sticky="nsew")
-        self.combobox_1 = ctk.CTkComboBox(self.frame_controls, width=controls_width, values=["VF2", "Color Refinement", "Weisfeiler-Lehman", "Bliss", "Laszlo-Babai"])
+        self.combobox_1 = ctk.CTkComboBox(self.frame_controls, width=controls_width, values=list(ALGORITHMS))
         self.combobox_1.grid(row=2, column=0, padx=(10,10), pady=(0,10), sticky="nsew")
         self.button_check = ctk.CTkButton(self.frame_controls, width=controls_width, text="Проверить на изоморфизм", command=self.check_isomorphism, fg_color="green")
         self.button_check.grid(row=3, column=0, padx=(10,10), pady=(0,10), sticky="nsew")
+        self.button_cancel = ctk.CTkButton(self.frame_controls, width=controls_width, text="Отменить", command=self.cancel_task, fg_color="gray", state="disabled")
+        self.button_cancel.grid(row=4, column=0, padx=(10,10), pady=(0,10), sticky="nsew")
+        self.label_progress = ctk.CTkLabel(self.frame_controls, width=controls_width, text="", anchor="w")
+        self.label_progress.grid(row=5, column=0, padx=(10,10), pady=(0,10), sticky="nsew")
         self.log_widget = ctk.CTkTextbox(self.frame_controls, width=controls_width, wrap="word", state='disabled', height=log_height)
-        self.log_widget.grid(row=4, column=0, padx=(10,10), pady=(0,10), sticky="nsew")
+        self.log_widget.grid(row=6, column=0, padx=(10,10), pady=(0,10), sticky="nsew")
         self.log_widget.grid_propagate(False)
         self.button_clear_log = ctk.CTkButton(self.frame_controls, width=controls_width, text="Очистить лог", command=self.clear_log)
-        self.button_clear_log.grid(row=5, column=0, padx=(10,10), pady=(0,10), sticky="nsew")
+        self.button_clear_log.grid(row=7, column=0, padx=(10,10), pady=(0,10), sticky="nsew")
         self.label_graph1 = ctk.CTkLabel(self.frame_graph1, text="Чтобы загрузить граф схемы 1\n" + 
                                                                  "для дальнейшей проверки на изоморфизм, \n" +
                                                                  "нажмите на кнопку «Загрузить схему 1 (JSON)».")
@@ -130,35 +188,37 @@ class GraphIsomorphismCheckerApp(ctk.CTk):
         self.graph1 = None
         self.graph2 = None
 
+        # Background work: one task at a time, results handed back to the Tk
+        # thread through a queue polled with after()
+        self.worker = None
+        self.cancel_token = None
+        self.task_results = queue.Queue()
+
     def load_graph1(self):
-        file_path = filedialog.askopenfilename(filetypes=[("JSON files", "*.json")])
-        if file_path:
-            with open(file_path, "r") as f:
-                data = json.load(f)
-                self.graph1 = self.create_graph(data)
-                GraphDisplay.display_graph(self, self.graph1, self.frame_graph1)
-            self.log(f"Граф 1 загружен из файла {file_path}", "MESSAGE")
-        else:
-            self.log("Загрузка графа 1 отменена.", "MESSAGE")
+        self.load_graph(1, self.frame_graph1)
 
     def load_graph2(self):
-        file_path = filedialog.askopenfilename(filetypes=[("JSON files", "*.json")])
-        if file_path:
-            with open(file_path, "r") as f:
-                data = json.load(f)
-                self.graph2 = self.create_graph(data)
-                GraphDisplay.display_graph(self, self.graph2, self.frame_graph2)
-            self.log(f"Граф 2 загружен из файла {file_path}", "MESSAGE")
-        else:
-            self.log("Загрузка графа 2 отменена.", "MESSAGE")
+        self.load_graph(2, self.frame_graph2)
+
+    def load_graph(self, index, frame):
+        file_path = filedialog.askopenfilename(filetypes=GRAPH_FILETYPES)
+        if not file_path:
+            self.log(f"Загрузка графа {index} отменена.", "MESSAGE")
+            return
+
+        def task():
+            with recording() as recorder:
+                graph = load_graph(file_path)
+            return graph, GraphDisplay.compute_layout(graph), recorder
+
+        def on_success(result):
+            graph, layout, recorder = result
+            setattr(self, f"graph{index}", graph)
+            GraphDisplay.display_graph(self, graph, frame, layout=layout)
+            self.log(f"Граф {index} загружен из файла {file_path}", "MESSAGE")
+            self.log_profile(recorder)
 
-    def create_graph(self, data):
-        graph = nx.Graph()
-        for node in data["nodes"]:
-            graph.add_node(node["id"], label=node["label"])
-        for edge in data["edges"]:
-            graph.add_edge(edge["source"], edge["target"])
-        return graph
+        self.start_task(task, on_success, f"Загрузка графа {index}...")
 
     def check_isomorphism(self):
         self.log("Проверка на изоморфизм...", "TEXT")
@@ -166,43 +226,112 @@ class GraphIsomorphismCheckerApp(ctk.CTk):
             self.log("Оба графа должны быть сперва загружены!", "FAILURE")
             return
         
-        start_time = timer()
-        is_isomorphic = isomorphism.GraphMatcher(self.graph1, self.graph2)
-        end_time = timer()
-        
         algorithm = self.combobox_1.get()
-        self.log(f"Выбранный алгоритм: {algorithm}", "INFO")
-        if algorithm == "VF2":
-            start_time = timer()
-            is_isomorphic = vf2_isomorphism(self.graph1, self.graph2)
-            end_time = timer()
-        elif algorithm == "Color Refinement":
-            start_time = timer()
-            is_isomorphic = color_refinement_isomorphism(self.graph1, self.graph2)
-            end_time = timer()
-        elif algorithm == "Weisfeiler-Lehman":
-            start_time = timer()
-            is_isomorphic = weisfeiler_lehman_isomorphism(self.graph1, self.graph2)
-            end_time = timer()
-        elif algorithm == "Bliss":
-            start_time = timer()
-            is_isomorphic = bliss_isomorphism(self.graph1, self.graph2)
-            end_time = timer()
-        elif algorithm == "Laszlo-Babai":
-            start_time = timer()
-            is_isomorphic = laszlo_babai_simplified_isomorphism(self.graph1, self.graph2)
-            end_time = timer()
-        else:
+        if algorithm not in ALGORITHMS:
             self.log("Пожалуйста, выберите алгоритм из выпадающего списка!", "MESSAGE")
             return
+        self.log(f"Выбранный алгоритм: {algorithm}", "INFO")
+        checker = ALGORITHMS[algorithm]
+        graph1, graph2 = self.graph1, self.graph2
 
-        elapsed_time = end_time - start_time
-        self.log(f"Время выполнения: {elapsed_time:.6f} секунд", "INFO")
-        
-        if is_isomorphic:
-            self.log("Графы изоморфны!", "SUCCESS")
+        def task():
+            from algos.checkers import CHECKERS
+            algorithm_function = CHECKERS[checker]
+            with recording() as recorder:
+                start_time = timer()
+                is_isomorphic = algorithm_function(graph1, graph2)
+            return is_isomorphic, timer() - start_time, recorder
+
+        def on_success(result):
+            is_isomorphic, elapsed_time, recorder = result
+            self.log(f"Время выполнения: {elapsed_time:.6f} секунд", "INFO")
+            self.log_profile(recorder)
+            if is_isomorphic:
+                self.log("Графы изоморфны!", "SUCCESS")
+            else:
+                self.log("Графы не изоморфны!", "FAILURE")
+
+        self.start_task(task, on_success)
+
+    def start_task(self, task, on_success, message=None):
+        if self.worker is not None:
+            self.log("Дождитесь завершения текущей операции или отмените её.", "MESSAGE")
+            return
+        if message:
+            self.log(message, "TEXT")
+        cancel_token = CancelToken()
+
+        def run():
+            try:
+                with progress_callback(cancel_token):
+                    result = task()
+                self.task_results.put(("done", on_success, result))
+            except Cancelled:
+                self.task_results.put(("cancelled", None, None))
+            except Exception as error:
+                self.task_results.put(("error", None, error))
+
+        self.cancel_token = cancel_token
+        self.worker = threading.Thread(target=run, daemon=True)
+        self.set_busy(True)
+        self.worker.start()
+        self.schedule(POLL_INTERVAL_MS, self.poll_task)
+
+    def poll_task(self):
+        try:
+            status, on_success, result = self.task_results.get_nowait()
+        except queue.Empty:
+            self.show_progress(self.cancel_token.latest)
+            self.schedule(POLL_INTERVAL_MS, self.poll_task)
+            return
+        self.worker.join()
+        self.worker = None
+        self.cancel_token = None
+        self.set_busy(False)
+        if status == "done":
+            on_success(result)
+        elif status == "cancelled":
+            self.log("Операция отменена.", "MESSAGE")
         else:
-            self.log("Графы не изоморфны!", "FAILURE")
+            self.log(f"Ошибка: {result}", "FAILURE")
+
+    def cancel_task(self):
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+            self.log("Отмена...", "MESSAGE")
+
+    def set_busy(self, busy):
+        state = "disabled" if busy else "normal"
+        for button in (self.button_load1, self.button_load2, self.button_check):
+            button.configure(state=state)
+        self.button_cancel.configure(state="normal" if busy else "disabled")
+        if not busy:
+            self.label_progress.configure(text="")
+
+    def show_progress(self, latest):
+        text = ", ".join(f"{PROGRESS_NAMES.get(stage, stage)}: {value}" for stage, value in list(latest.items()))
+        self.label_progress.configure(text=text)
+
+    def schedule(self, delay, callback):
+        def run():
+            self.after_callbacks.remove(callback_id)
+            callback()
+
+        callback_id = self.after(delay, run)
+        self.after_callbacks.append(callback_id)
+
+    def log_profile(self, recorder):
+        # Phase timings and counters recorded while the task ran
+        def name(path):
+            return " / ".join(PROFILE_NAMES.get(part, part) for part in path.split("/"))
+
+        for path, total in recorder.phase_totals().items():
+            calls = f" ({total['calls']} раз)" if total["calls"] > 1 else ""
+            self.log(f"  {name(path)}: {total['seconds']:.6f} секунд{calls}", "TEXT")
+        for counter, value in recorder.counters.items():
+            self.log(f"  {name(counter)}: {value}", "TEXT")
+        for series, values in recorder.series.items():
+            self.log(f"  {name(series)}: {', '.join(str(value) for value in values)}", "TEXT")
 
     def log(self, message, tag):
         self.log_widget.configure(state='normal')
@@ -221,6 +350,7 @@ class GraphIsomorphismCheckerApp(ctk.CTk):
         self.after_callbacks.clear()
 
     def destroy(self):
+        self.cancel_task() # Stop the background check, if any
         self.cancel_after_callbacks() # Cancel all scheduled tasks
         self.quit() # Stops the mainloop
         super().destroy() # Destroys the window and its children
@@ -0,0 +1,40 @@
+# The core API, importable as `from algos import CHECKERS` and so on. Each
+# name is imported from its module on first use, so `import algos` costs
+# nothing and a script only pays for the modules it touches. The core needs
+# only NumPy; networkx is imported by CSRGraph.to_networkx and matplotlib by
+# the GUI preview, each when first used.
+
+_EXPORTS = {
+    'CSRGraph': 'algos.csr_graph',
+    'as_csr_graph': 'algos.csr_graph',
+    'load_graph_from_json': 'algos.csr_graph',
+    'load_graph': 'algos.binary_graph',
+    'save_binary_graph': 'algos.binary_graph',
+    'CHECKERS': 'algos.checkers',
+    'MAPPINGS': 'algos.checkers',
+    'GraphFingerprint': 'algos.fingerprint',
+    'canonical_form': 'algos.bliss',
+    'canonical_labeling': 'algos.bliss',
+    'verify_mapping': 'algos.mapping',
+    'certified_mapping': 'algos.mapping',
+    'subgraph_matches': 'algos.subgraph',
+    'IncrementalGraph': 'algos.incremental',
+    'GraphCache': 'algos.cache',
+    'isomorphism_classes': 'algos.batch',
+    'recording': 'algos.instrument',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module 'algos' has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
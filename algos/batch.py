@@ -0,0 +1,79 @@
+import os
+import sys
+
+from functools import partial
+
+from algos.bliss import canonical_form
+from algos.binary_graph import EXTENSION, load_binary_fingerprint, load_graph
+from algos.fingerprint import GraphFingerprint
+
+
+GRAPH_EXTENSIONS = ('.json', EXTENSION)
+
+
+def graph_paths(source):
+    if isinstance(source, (str, os.PathLike)) and os.path.isdir(source):
+        return sorted(os.path.join(source, name) for name in os.listdir(source) if name.endswith(GRAPH_EXTENSIONS))
+    if isinstance(source, (str, os.PathLike)):
+        return [source]
+    return list(source)
+
+
+def fingerprint_key(file_path, cache=None, use_labels=True):
+    if cache is not None:
+        return cache.fingerprint(file_path, use_labels=use_labels).key()
+    if use_labels and str(file_path).endswith(EXTENSION):
+        fingerprint = load_binary_fingerprint(file_path)
+        if fingerprint is not None:
+            return fingerprint.key()
+    return GraphFingerprint(load_graph(file_path), use_labels=use_labels).key()
+
+
+def certificate(file_path, cache=None, use_labels=True):
+    if cache is not None:
+        return cache.certificate(file_path, use_labels=use_labels)
+    return canonical_form(load_graph(file_path), use_labels)
+
+
+def isomorphism_classes(source, cache=None, use_labels=True, map_function=None):
+    # One fingerprint per graph buckets the inputs; canonical certificates are
+    # computed only for graphs that share a bucket, so no pair is ever
+    # compared directly. Graphs are reloaded for the certificate pass instead
+    # of being held in memory between passes. map_function(function, paths)
+    # may replace the two per-file passes, e.g. with a process pool, and is
+    # expected to pass its own cache to function.
+    paths = graph_paths(source)
+    if map_function is None:
+        keys = [fingerprint_key(file_path, cache, use_labels) for file_path in paths]
+    else:
+        keys = map_function(partial(fingerprint_key, use_labels=use_labels), paths)
+    buckets = {}
+    for file_path, key in zip(paths, keys):
+        buckets.setdefault(key, []).append(file_path)
+
+    shared = [file_path for bucket in buckets.values() if len(bucket) > 1 for file_path in bucket]
+    if map_function is None:
+        certificates = [certificate(file_path, cache, use_labels) for file_path in shared]
+    else:
+        certificates = map_function(partial(certificate, use_labels=use_labels), shared)
+    certificates = dict(zip(shared, certificates))
+
+    classes = []
+    for bucket in buckets.values():
+        if len(bucket) == 1:
+            classes.append(bucket)
+            continue
+        by_certificate = {}
+        for file_path in bucket:
+            by_certificate.setdefault(certificates[file_path], []).append(file_path)
+        classes.extend(by_certificate.values())
+    order = {file_path: i for i, file_path in enumerate(paths)}
+    return sorted(classes, key=lambda group: order[group[0]])
+
+
+if __name__ == "__main__":
+    source = sys.argv[1:] or 'graphs'
+    if len(source) == 1:
+        source = source[0]
+    for i, group in enumerate(isomorphism_classes(source)):
+        print(f"Class {i + 1}: {', '.join(group)}")
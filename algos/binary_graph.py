@@ -0,0 +1,188 @@
+import os
+import sys
+import mmap
+import json
+import struct
+import numpy as np
+
+from timeit import default_timer as timer
+
+from algos.csr_graph import PLAIN_EDGE, CSRGraph, load_graph_from_json
+from algos.fingerprint import FINGERPRINT_VERSION, GraphFingerprint, values_from_json, values_to_json
+from algos.instrument import phase
+
+
+MAGIC = b'ISOG'
+FORMAT_VERSION = 3
+EXTENSION = '.isog'
+
+# Section order in the header table; each entry is (offset, length in bytes).
+# Version 2 appends the edge colors, empty for a plain graph, and a JSON
+# object with the edge color names and the directed and multigraph flags.
+# Version 3 stores the fingerprint as a JSON object instead of a pickle;
+# the fingerprints of older files are ignored rather than unpickled.
+SECTIONS = ('labels', 'indptr', 'indices', 'label_offsets', 'label_blob', 'node_ids', 'fingerprint',
+            'edge_colors', 'edge_color_names')
+_VERSION_SECTIONS = {1: SECTIONS[:7], 2: SECTIONS, 3: SECTIONS}
+_PREFIX = struct.Struct('<4sI')
+_HEADERS = {version: struct.Struct('<4sII' + 'QQ' * len(sections)) for version, sections in _VERSION_SECTIONS.items()}
+_HEADER = _HEADERS[FORMAT_VERSION]
+_ALIGNMENT = 64
+
+# node_ids section kinds
+_NODE_IDS_INT64 = 0
+_NODE_IDS_JSON = 1
+
+
+class LabelTable:
+    # Label names decoded on access from a UTF-8 blob and an offsets array,
+    # so opening a graph does not touch every label.
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return bytes(self.blob[self.offsets[index]:self.offsets[index + 1]]).decode('utf-8')
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def _node_ids_section(graph):
+    node_ids = graph.node_ids
+    if isinstance(node_ids, np.ndarray) and node_ids.dtype.kind in 'iu':
+        return _NODE_IDS_INT64, node_ids.astype(np.int64).tobytes()
+    node_ids = list(node_ids)
+    if all(isinstance(node_id, int) and not isinstance(node_id, bool) for node_id in node_ids):
+        return _NODE_IDS_INT64, np.array(node_ids, dtype=np.int64).tobytes()
+    return _NODE_IDS_JSON, json.dumps(node_ids).encode('utf-8')
+
+
+def save_binary_graph(graph, file_path, fingerprint_values=None):
+    encoded = [str(name).encode('utf-8') for name in graph.label_names]
+    label_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(name) for name in encoded], out=label_offsets[1:])
+    node_ids_kind, node_ids = _node_ids_section(graph)
+    payloads = {
+        'labels': np.ascontiguousarray(graph.labels, dtype=np.int32).tobytes(),
+        'indptr': np.ascontiguousarray(graph.indptr, dtype=np.int64).tobytes(),
+        'indices': np.ascontiguousarray(graph.indices, dtype=np.int32).tobytes(),
+        'label_offsets': label_offsets.tobytes(),
+        'label_blob': b''.join(encoded),
+        'node_ids': node_ids,
+        'fingerprint': b'' if fingerprint_values is None else json.dumps(
+            {'version': FINGERPRINT_VERSION, 'values': values_to_json(fingerprint_values)}).encode('utf-8'),
+        'edge_colors': b'',
+        'edge_color_names': b'',
+    }
+    if graph.edge_colors is not None or graph.directed or graph.multigraph:
+        colors, names = graph.edge_color_codes()
+        payloads['edge_colors'] = np.ascontiguousarray(colors, dtype=np.int32).tobytes()
+        payloads['edge_color_names'] = json.dumps({'names': names, 'directed': graph.directed,
+                                                   'multigraph': graph.multigraph}).encode('utf-8')
+    table = []
+    offset = _HEADER.size
+    for name in SECTIONS:
+        offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+        table += [offset, len(payloads[name])]
+        offset += len(payloads[name])
+    with open(file_path, 'wb') as file:
+        file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, node_ids_kind, *table))
+        for name, section_offset in zip(SECTIONS, table[::2]):
+            file.write(b'\0' * (section_offset - file.tell()))
+            file.write(payloads[name])
+
+
+def map_graph_file(file_path):
+    with open(file_path, 'rb') as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _open_sections(file_path, buffer=None):
+    if buffer is None:
+        buffer = map_graph_file(file_path)
+    magic, version = _PREFIX.unpack_from(buffer)
+    if magic != MAGIC or version not in _HEADERS:
+        raise ValueError(f'{file_path} is not a {EXTENSION} graph file of a known version')
+    _, _, node_ids_kind, *table = _HEADERS[version].unpack_from(buffer)
+    sections = {name: (table[2 * i], table[2 * i + 1]) for i, name in enumerate(_VERSION_SECTIONS[version])}
+    return buffer, version, node_ids_kind, sections
+
+
+def load_binary_graph(file_path, buffer=None):
+    # Arrays are zero-copy views of a shared read-only mapping of the file,
+    # so processes opening the same file share its page-cache pages. A caller
+    # that already mapped the file with map_graph_file can pass the mapping.
+    buffer, _, node_ids_kind, sections = _open_sections(file_path, buffer)
+
+    def array(name, dtype):
+        offset, length = sections[name]
+        return np.frombuffer(buffer, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=offset)
+
+    offset, length = sections['label_blob']
+    label_names = LabelTable(array('label_offsets', np.int64), memoryview(buffer)[offset:offset + length])
+    if node_ids_kind == _NODE_IDS_INT64:
+        node_ids = array('node_ids', np.int64)
+    else:
+        offset, length = sections['node_ids']
+        node_ids = json.loads(buffer[offset:offset + length].decode('utf-8'))
+    edge_colors = edge_color_names = None
+    directed = multigraph = False
+    offset, length = sections.get('edge_color_names', (0, 0))
+    if length:
+        data = json.loads(buffer[offset:offset + length].decode('utf-8'))
+        directed, multigraph = data['directed'], data['multigraph']
+        names = [tuple(tuple(part) for part in name) for name in data['names']]
+        if names != [PLAIN_EDGE]:
+            edge_colors, edge_color_names = array('edge_colors', np.int32), names
+    return CSRGraph(node_ids, array('labels', np.int32), label_names,
+                    array('indptr', np.int64), array('indices', np.int32),
+                    edge_colors, edge_color_names, directed, multigraph)
+
+
+def load_binary_fingerprint(file_path):
+    # The stored fingerprint is the labelled one; None when the file has
+    # none, predates format version 3 or was written by another fingerprint
+    # version.
+    buffer, version, _, sections = _open_sections(file_path)
+    offset, length = sections['fingerprint']
+    if length == 0 or version < 3:
+        return None
+    data = json.loads(buffer[offset:offset + length].decode('utf-8'))
+    if data['version'] != FINGERPRINT_VERSION:
+        return None
+    return GraphFingerprint.from_values(values_from_json(data['values']))
+
+
+def load_graph(file_path):
+    if str(file_path).endswith(EXTENSION):
+        with phase('load'):
+            return load_binary_graph(file_path)
+    return load_graph_from_json(file_path)
+
+
+def convert_json_to_binary(json_path, binary_path=None, with_fingerprint=True):
+    binary_path = binary_path or os.path.splitext(json_path)[0] + EXTENSION
+    graph = load_graph_from_json(json_path)
+    fingerprint_values = GraphFingerprint(graph).compute_all().values if with_fingerprint else None
+    save_binary_graph(graph, binary_path, fingerprint_values)
+    return binary_path
+
+
+if __name__ == "__main__":
+    for json_path in sys.argv[1:] or sorted(os.path.join('graphs', name) for name in os.listdir('graphs')
+                                            if name.endswith('.json')):
+        binary_path = convert_json_to_binary(json_path)
+        start_time = timer()
+        graph = load_binary_graph(binary_path)
+        elapsed_time = timer() - start_time
+        print(f"{json_path} -> {binary_path}: {os.path.getsize(json_path)} -> {os.path.getsize(binary_path)} bytes, "
+              f"{graph.num_nodes} nodes, opened in {elapsed_time * 1000:.3f} ms")
@@ -1,53 +1,521 @@
-import json
-import networkx as nx
-from collections import defaultdict
-
-
-def load_graph_from_json(file_path):
-    with open(file_path, 'r') as file:
-        data = json.load(file)
-    G = nx.Graph()
-    for node in data['nodes']:
-        G.add_node(node['id'], label=node['label'])
-    for edge in data['edges']:
-        G.add_edge(edge['source'], edge['target'])
-    return G
-
-
-def get_node_labels(graph):
-    labels = nx.get_node_attributes(graph, 'label')
-    return {node: labels[node] for node in graph.nodes()}
-
-
-def refine_labels(graph, labels):
-    new_labels = {}
-    for node in graph.nodes():
-        neighbor_labels = sorted(labels[neighbor] for neighbor in graph.neighbors(node))
-        new_labels[node] = labels[node] + ''.join(str(label) for label in neighbor_labels)
-    return new_labels
-
-
-def canonical_form(graph, iterations=3):
-    labels = get_node_labels(graph)
-    for _ in range(iterations):
-        labels = refine_labels(graph, labels)
-        label_map = defaultdict(int)
-        for label in labels.values():
-            label_map[label] += 1
-        new_label_map = {label: str(i) for i, label in enumerate(sorted(label_map.keys()))}
-        labels = {node: new_label_map[label] for node, label in labels.items()}
-    return set(labels.values())
-
-
-def bliss_isomorphism(graph1, graph2):
-    canonical1 = canonical_form(graph1)
-    canonical2 = canonical_form(graph2)
+import hashlib
+import numpy as np
+
+from algos.csr_graph import CSRGraph, as_csr_graph, load_graph_from_json
+from algos.instrument import count, phase
+from algos.progress import report
+from algos.refinement import edge_hashes, label_hashes, mix_hashes
+
+
+# Bump when the certificate layout or the search changes
+CANONICAL_VERSION = 4
+
+_SALT = np.uint64(0x632be59bd9b4e019)
+
+
+def ordered_partition(values):
+    # Colors as cell start positions: every node's color is the number of
+    # nodes with a smaller value, so cells are ordered by value and the
+    # colors of a discrete partition are a labeling.
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    starts = np.ones(len(order), dtype=bool)
+    starts[1:] = sorted_values[1:] != sorted_values[:-1]
+    colors = np.empty(len(order), dtype=np.int64)
+    colors[order] = np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0))
+    return colors
+
+
+def _run_starts(values):
+    # Mask of the first element of every run of equal values
+    starts = np.empty(len(values), dtype=bool)
+    starts[:1] = True
+    np.not_equal(values[1:], values[:-1], out=starts[1:])
+    return starts
+
+
+def _round_hash(*arrays):
+    digest = hashlib.blake2b(digest_size=8)
+    for array in arrays:
+        digest.update(array)
+    return int.from_bytes(digest.digest(), 'little')
+
+
+def refine_partition(graph, colors, splitters, slot_hashes=None, trace=None, bound=None, keep=None):
+    # Refines an ordered partition in place to the coarsest equitable one,
+    # starting from the cells listed in splitters: every cell is split by
+    # the hash of each node's edges into the splitter cells, and of the
+    # pieces of a split cell all but one largest become splitters in turn
+    # (Hopcroft's trick). Only the rows of splitter cells are read, so a
+    # refinement after individualizing one node costs about the edges it
+    # reaches rather than a pass over the graph. Nodes without edges into
+    # the splitters keep their color and the others take new cells after
+    # them, ordered by hash, so the result does not depend on node numbering.
+    # With a trace list every round appends a hash of how it split cells:
+    # the colors and sizes of the pieces and the signatures that told them
+    # apart. Once the trace is smaller than bound (a smaller
+    # round hash after an equal prefix, or ending early) and no longer equal
+    # to keep, the refinement gives up and returns None.
+    num_nodes = graph.num_nodes
+    sizes = np.bincount(colors, minlength=num_nodes)
+    splitters = np.asarray(splitters, dtype=np.int64)
+    is_splitter = np.zeros(num_nodes, dtype=bool)
+    rounds = 0
+    behind = False
+    while len(splitters):
+        rounds += 1
+        is_splitter[splitters] = True
+        members = np.flatnonzero(is_splitter[colors])
+        is_splitter[splitters] = False
+        degrees = graph.indptr[members + 1] - graph.indptr[members]
+        num_slots = int(degrees.sum())
+        if num_slots == 0:
+            break
+        slots = np.repeat(graph.indptr[members] - np.cumsum(degrees) + degrees, degrees) + np.arange(num_slots)
+        values = np.repeat(colors[members], degrees).astype(np.uint64) + _SALT
+        if slot_hashes is not None:
+            values ^= slot_hashes[slots]
+        targets = graph.indices[slots]
+        order = np.argsort(targets, kind='stable')
+        targets = targets[order]
+        values = mix_hashes(values[order])
+        firsts = np.flatnonzero(_run_starts(targets))
+        touched = targets[firsts].astype(np.int64)
+        signatures = np.add.reduceat(values, firsts)
+
+        # Touched nodes grouped by (cell, signature)
+        order = np.lexsort((signatures, colors[touched]))
+        touched, signatures = touched[order], signatures[order]
+        cells = colors[touched]
+        cell_firsts = _run_starts(cells)
+        group_firsts = cell_firsts | _run_starts(signatures)
+        cell_index = np.cumsum(cell_firsts) - 1
+        group_index = np.cumsum(group_firsts) - 1
+        cell_starts = np.flatnonzero(cell_firsts)
+        group_starts = np.flatnonzero(group_firsts)
+        cell_colors = cells[cell_starts]
+        untouched = sizes[cell_colors] - np.diff(cell_starts, append=len(touched))
+        new_colors = cells + untouched[cell_index] + group_starts[group_index] - cell_starts[cell_index]
+        group_cells = cell_index[group_starts]
+        group_sizes = np.diff(group_starts, append=len(touched))
+        pieces = np.bincount(group_cells, minlength=len(cell_starts)) + (untouched > 0)
+        split = pieces[group_cells] > 1
+        if not split.any():
+            break
+        group_colors = new_colors[group_starts]
+        if trace is not None:
+            # A piece's color is its cell's plus the nodes before it, so the
+            # colors also tell which cells split and what was left of them
+            trace.append(_round_hash(group_colors, group_sizes, signatures[group_starts]))
+            position = len(trace) - 1
+            if bound is not None and not behind:
+                if position >= len(bound) or trace[-1] > bound[position]:
+                    bound = None
+                elif trace[-1] < bound[position]:
+                    behind = True
+            if keep is not None and (position >= len(keep) or trace[-1] != keep[position]):
+                keep = None
+            if behind and keep is None:
+                count('equitable refinement rounds', rounds)
+                return None
+        colors[touched] = new_colors
+        sizes[cell_colors[untouched > 0]] = untouched[untouched > 0]
+        sizes[group_colors] = group_sizes
+
+        # Pieces of the split cells, the largest (first on ties) left out
+        kept = untouched > 0
+        piece_cells = np.concatenate((group_cells[split], np.flatnonzero(kept & (pieces > 1))))
+        piece_colors = np.concatenate((group_colors[split], cell_colors[kept & (pieces > 1)]))
+        piece_sizes = sizes[piece_colors]
+        order = np.lexsort((piece_colors, -piece_sizes, piece_cells))
+        largest = _run_starts(piece_cells[order])
+        splitters = piece_colors[order][~largest]
+    count('equitable refinement rounds', rounds)
+    if trace is not None:
+        behind = behind or bound is not None and len(trace) < len(bound)
+        if behind and (keep is None or len(trace) != len(keep)):
+            return None
+    return colors
+
+
+def individualize(graph, colors, node, slot_hashes=None, trace=None, bound=None, keep=None):
+    # The node moves to the end of its cell as a cell of its own, which is
+    # then the only splitter needed
+    colors = colors.copy()
+    size = int(np.count_nonzero(colors == colors[node]))
+    colors[node] += size - 1
+    return refine_partition(graph, colors, [colors[node]], slot_hashes, trace, bound, keep)
+
+
+def individualize_twins(colors, twins):
+    # Cells whose nodes all belong to one class of twins hold nodes that
+    # any permutation of the cell swaps by an automorphism, so every way
+    # of making them discrete leads to the same certificates. They are
+    # split in index order in one step instead of being searched, and as
+    # all nodes outside see the same edges to every twin, no other cell
+    # splits. Returns None when there are none.
+    sizes = np.bincount(colors, minlength=len(colors))
+    candidates = np.flatnonzero((sizes[colors] > 1) & (twins >= 0))
+    if len(candidates) == 0:
+        return None
+    lowest = np.full(len(colors), len(colors), dtype=np.int64)
+    highest = np.full(len(colors), -1, dtype=np.int64)
+    members = np.flatnonzero(sizes[colors] > 1)
+    np.minimum.at(lowest, colors[members], twins[members])
+    np.maximum.at(highest, colors[members], twins[members])
+    twin_cell = (lowest == highest) & (lowest >= 0)
+    nodes = candidates[twin_cell[colors[candidates]]]
+    if len(nodes) == 0:
+        return None
+    nodes = nodes[np.lexsort((nodes, colors[nodes]))]
+    cells = colors[nodes]
+    firsts = np.flatnonzero(_run_starts(cells))
+    ranks = np.arange(len(nodes)) - np.repeat(firsts, np.diff(firsts, append=len(nodes)))
+    colors = colors.copy()
+    colors[nodes] = cells + ranks
+    return colors
+
+
+def twin_classes(graph, node_hashes):
+    # For every node, the lowest index of its class of twins, or -1: nodes
+    # with equal labels whose transposition is an automorphism, i.e. equal
+    # neighborhoods apart from each other, either not adjacent (equal open
+    # neighborhoods) or adjacent (equal closed ones). Candidates are grouped
+    # by a hash of the neighborhood and each is checked exactly against the
+    # lowest node of its group.
+    num_nodes = graph.num_nodes
+    twins = np.full(num_nodes, -1, dtype=np.int64)
+    prefix = np.zeros(len(graph.indices) + 1, dtype=np.uint64)
+    np.cumsum(mix_hashes(graph.indices.astype(np.uint64) + _SALT), out=prefix[1:])
+    neighbor_sums = prefix[graph.indptr[1:]] - prefix[graph.indptr[:-1]]
+    self_hashes = mix_hashes(np.arange(num_nodes, dtype=np.uint64) + _SALT)
+    for sums in (neighbor_sums, neighbor_sums + self_hashes):
+        keys = mix_hashes(mix_hashes(node_hashes) ^ sums)
+        _, groups, group_sizes = np.unique(keys, return_inverse=True, return_counts=True)
+        candidates = np.flatnonzero((group_sizes[groups.reshape(-1)] > 1) & (twins < 0))
+        if len(candidates) == 0:
+            continue
+        candidates = candidates[np.argsort(groups.reshape(-1)[candidates], kind='stable')]
+        group_of = groups.reshape(-1)[candidates].tolist()
+        first = 0
+        for i in range(1, len(candidates) + 1):
+            if i == len(candidates) or group_of[i] != group_of[first]:
+                _check_twins(graph, node_hashes, candidates[first:i].tolist(), twins)
+                first = i
+    return twins
+
+
+def _check_twins(graph, node_hashes, nodes, twins):
+    def row(node, swap):
+        neighbors = graph.neighbors(node).tolist()
+        if swap is not None:
+            neighbors = [swap[1] if neighbor == swap[0] else swap[0] if neighbor == swap[1] else neighbor
+                         for neighbor in neighbors]
+        if graph.edge_colors is None:
+            return sorted(neighbors)
+        start = graph.indptr[node]
+        return sorted(zip(neighbors, graph.edge_colors[start:start + len(neighbors)].tolist()))
+
+    first = nodes[0]
+    twins_found = [node for node in nodes[1:] if node_hashes[node] == node_hashes[first]
+                   and row(first, (first, node)) == row(node, None)]
+    if twins_found:
+        twins[[first] + twins_found] = first
+
+
+def target_cell(colors):
+    # First smallest non-singleton cell
+    sizes = np.bincount(colors)
+    candidates = np.flatnonzero(sizes > 1)
+    if len(candidates) == 0:
+        return None
+    color = candidates[np.argmin(sizes[candidates])]
+    return np.flatnonzero(colors == color)
+
+
+def connected_components(graph):
+    # Per node, the lowest index in its component: minimum labels are pulled
+    # over the edges and shortcut through each other until nothing changes
+    components = np.arange(graph.num_nodes)
+    sources = graph.edge_sources()
+    while True:
+        pulled = components.copy()
+        np.minimum.at(pulled, sources, components[graph.indices])
+        pulled = pulled[pulled]
+        if np.array_equal(pulled, components):
+            return components
+        components = pulled
+
+
+def _component_graph(graph, nodes):
+    # The subgraph on a sorted list of nodes that no edge leaves
+    degrees = graph.indptr[nodes + 1] - graph.indptr[nodes]
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(degrees, out=indptr[1:])
+    slots = np.repeat(graph.indptr[nodes] - indptr[:-1], degrees) + np.arange(int(indptr[-1]))
+    edge_colors = None if graph.edge_colors is None else graph.edge_colors[slots]
+    indices = np.searchsorted(nodes, graph.indices[slots])
+    return CSRGraph(nodes, graph.labels[nodes], graph.label_names, indptr, indices, edge_colors,
+                    graph.edge_color_names, graph.directed, graph.multigraph)
+
+
+def certificate(graph, node_hashes, labeling, slot_hashes=None):
+    # Labels in canonical order followed by the sorted canonical edge keys
+    # and, for a graph with edge colors, the edge color hashes in key order.
+    # Each edge is taken from the slot of its lower canonical endpoint, so
+    # its color is seen from that endpoint.
+    num_nodes = graph.num_nodes
+    canonical_labels = np.empty(num_nodes, dtype=np.uint64)
+    canonical_labels[labeling] = node_hashes
+    sources = labeling[graph.edge_sources()].astype(np.int64)
+    targets = labeling[graph.indices].astype(np.int64)
+    lower = sources <= targets
+    keys = sources[lower] * num_nodes + targets[lower]
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    header = np.array([num_nodes, len(keys)], dtype=np.int64)
+    data = header.tobytes() + canonical_labels.tobytes() + keys.tobytes()
+    if slot_hashes is not None:
+        data += slot_hashes[lower][order].tobytes()
+    return data
+
+
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, item):
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, first, second):
+        self.parent[self.find(first)] = self.find(second)
+
+
+class CanonicalSearch:
+    # Individualization-refinement search tree in the style of nauty/bliss.
+    # Every tree node refines the coloring to an equitable partition, from
+    # the cell that was split only, makes cells of interchangeable twins
+    # discrete without branching, and branches on the vertices of the first
+    # smallest non-singleton cell.
+    # The canonical leaf is the one with the largest (invariant trace,
+    # certificate), where the trace holds the refinement trace of every level.
+    # A child whose refinement falls behind the best leaf's trace and leaves
+    # the first leaf's is abandoned mid-refinement; children that follow the
+    # first leaf's trace are kept to find automorphisms, which prune children
+    # in the same orbit.
+    def __init__(self, graph, use_labels=True, node_hashes=None):
+        self.graph = as_csr_graph(graph)
+        num_nodes = self.graph.num_nodes
+        if node_hashes is not None:
+            self.node_hashes = node_hashes
+        elif use_labels:
+            self.node_hashes = label_hashes(self.graph)
+        else:
+            self.node_hashes = np.zeros(num_nodes, dtype=np.uint64)
+        self.edge_hashes = edge_hashes(self.graph)
+        self.twins = twin_classes(self.graph, self.node_hashes)
+        self.generators = []
+        self.search_nodes = 0
+        self.pruned = 0
+        self.first_leaf = None
+        self.best_leaf = None
+
+    def _orbits(self, path):
+        orbits = _UnionFind(self.graph.num_nodes)
+        for generator in self.generators:
+            if all(generator[node] == node for node in path):
+                for node in np.flatnonzero(generator != np.arange(len(generator))).tolist():
+                    orbits.union(node, int(generator[node]))
+        return orbits
+
+    def _leaf(self, colors, path, trace):
+        labeling = colors.astype(np.int64)
+        leaf = (trace, certificate(self.graph, self.node_hashes, labeling, self.edge_hashes), labeling, path)
+        if self.first_leaf is None:
+            self.first_leaf = self.best_leaf = leaf
+            return None
+        for reference in (self.first_leaf, self.best_leaf):
+            if leaf[:2] == reference[:2]:
+                # Automorphism mapping this leaf's labeling onto the reference's
+                inverse = np.empty_like(reference[2])
+                inverse[reference[2]] = np.arange(len(inverse))
+                self.generators.append(inverse[labeling])
+                if reference is self.first_leaf:
+                    common = 0
+                    while common < len(path) and path[common] == self.first_leaf[3][common]:
+                        common += 1
+                    return common
+                return None
+        if leaf[:2] > self.best_leaf[:2]:
+            self.best_leaf = leaf
+        return None
+
+    def _trace_behind(self, trace):
+        if self.best_leaf is None:
+            return False
+        best_trace, first_trace = self.best_leaf[0], self.first_leaf[0]
+        return trace[:len(best_trace)] < best_trace[:len(trace)] and trace != first_trace[:len(trace)]
+
+    def _level_trace(self, leaf, trace):
+        # The leaf's refinement trace at the level below a node whose trace
+        # so far equals the leaf's, or None
+        if leaf is None or len(leaf[0]) <= len(trace) or leaf[0][:len(trace)] != trace:
+            return None
+        return leaf[0][len(trace)]
+
+    def _without_twins(self, colors):
+        twins_split = individualize_twins(colors, self.twins)
+        return colors if twins_split is None else twins_split
+
+    def run(self):
+        with phase('search'):
+            self._search()
+        count('search nodes', self.search_nodes)
+        count('pruned branches', self.pruned)
+        count('automorphisms', len(self.generators))
+        return self
+
+    def _search(self):
+        colors = ordered_partition(self.node_hashes)
+        colors = self._without_twins(refine_partition(self.graph, colors, np.unique(colors), self.edge_hashes))
+        if target_cell(colors) is not None:
+            components = connected_components(self.graph)
+            if components.max(initial=0) > 0:
+                self._search_components(colors, components)
+                return
+        self._search_tree(colors)
+
+    def _search_components(self, colors, components):
+        # Copies of a component would make the tree branch over which copy
+        # comes first at every level. Instead every component with nodes in
+        # non-singleton cells gets its own search, with the root colors as
+        # node labels, and these nodes are ordered within their cells by
+        # component certificate and then by canonical position in the
+        # component. Components with equal certificates are isomorphic and
+        # can be swapped by an automorphism, so their order does not matter.
+        sizes = np.bincount(colors, minlength=len(colors))
+        unresolved = np.flatnonzero(sizes[colors] > 1)
+        order = unresolved[np.argsort(components[unresolved], kind='stable')]
+        starts = np.flatnonzero(_run_starts(components[order]))
+        by_component = np.argsort(components, kind='stable')
+        bounds = np.searchsorted(components[by_component], components[order[starts]])
+        ends = np.searchsorted(components[by_component], components[order[starts]], side='right')
+        positions = np.empty(len(colors), dtype=np.int64)
+        certificates = []
+        for start, end in zip(bounds.tolist(), ends.tolist()):
+            nodes = np.sort(by_component[start:end])
+            search = CanonicalSearch(_component_graph(self.graph, nodes),
+                                     node_hashes=colors[nodes].astype(np.uint64)).run()
+            self.search_nodes += search.search_nodes
+            self.pruned += search.pruned
+            positions[nodes] = search.best_leaf[2]
+            certificates.append(search.best_leaf[1])
+        ranks = np.empty(len(certificates), dtype=np.int64)
+        ranks[sorted(range(len(certificates)), key=certificates.__getitem__)] = np.arange(len(certificates))
+        component_ranks = np.repeat(ranks, np.diff(starts, append=len(order)))
+        cell_order = np.lexsort((positions[order], component_ranks, colors[order]))
+        nodes = order[cell_order]
+        cells = colors[nodes]
+        firsts = np.flatnonzero(_run_starts(cells))
+        labeling = colors.copy()
+        labeling[nodes] = cells + np.arange(len(nodes)) - np.repeat(firsts, np.diff(firsts, append=len(nodes)))
+        self._leaf(labeling, [], ())
+
+    def _search_tree(self, colors):
+        # Stack frames: [colors, path, trace, cell, next child index,
+        # explored children, (generator count, orbits)]
+        stack = [[colors, [], (), None, 0, [], (0, None)]]
+        while stack:
+            frame = stack[-1]
+            colors, path, trace = frame[0], frame[1], frame[2]
+            if frame[3] is None:
+                self.search_nodes += 1
+                report('search nodes', self.search_nodes)
+                cell = target_cell(colors)
+                if cell is None:
+                    stack.pop()
+                    jump = self._leaf(colors, path, trace)
+                    if jump is not None:
+                        del stack[jump + 1:]
+                    continue
+                frame[3] = cell.tolist()
+            cell = frame[3]
+            if frame[4] >= len(cell):
+                stack.pop()
+                continue
+            node = cell[frame[4]]
+            frame[4] += 1
+            explored = frame[5]
+            if explored:
+                if frame[6][0] != len(self.generators):
+                    frame[6] = (len(self.generators), self._orbits(path))
+                orbits = frame[6][1]
+                if orbits is not None and orbits.find(node) in {orbits.find(other) for other in explored}:
+                    self.pruned += 1
+                    continue
+            explored.append(node)
+            level = []
+            child_colors = individualize(self.graph, colors, node, self.edge_hashes, level,
+                                         self._level_trace(self.best_leaf, trace), self._level_trace(self.first_leaf, trace))
+            if child_colors is None:
+                self.pruned += 1
+                continue
+            child_colors = self._without_twins(child_colors)
+            child_trace = trace + (tuple(level),)
+            if self._trace_behind(child_trace):
+                self.pruned += 1
+                continue
+            stack.append([child_colors, path + [node], child_trace, None, 0, [], (0, None)])
+
+
+def canonical_labeling(graph, use_labels=True):
+    search = CanonicalSearch(graph, use_labels).run()
+    _, certificate_bytes, labeling, _ = search.best_leaf
+    return labeling, certificate_bytes
+
+
+def canonical_form(graph, use_labels=True):
+    return canonical_labeling(graph, use_labels)[1]
+
+
+def canonical_mapping(graph1, graph2, use_labels=True):
+    # Equal certificates mean that the node at canonical position p in one
+    # graph corresponds to the node at position p in the other. Returns the
+    # graph2 node index of every graph1 node index, or None.
+    labeling1, certificate1 = canonical_labeling(graph1, use_labels)
+    labeling2, certificate2 = canonical_labeling(graph2, use_labels)
+    if certificate1 != certificate2:
+        return None
+    inverse2 = np.empty_like(labeling2)
+    inverse2[labeling2] = np.arange(len(labeling2))
+    return inverse2[labeling1]
+
+
+def bliss_mapping(graph1, graph2, use_labels=True):
+    graph1 = as_csr_graph(graph1)
+    graph2 = as_csr_graph(graph2)
+    mapping = canonical_mapping(graph1, graph2, use_labels)
+    if mapping is None:
+        return None
+    node_ids1 = graph1.node_id_list()
+    node_ids2 = graph2.node_id_list()
+    return {node_ids1[node1]: node_ids2[node2] for node1, node2 in enumerate(mapping.tolist())}
+
+
+def bliss_isomorphism(graph1, graph2, use_labels=True):
+    canonical1 = canonical_form(graph1, use_labels)
+    canonical2 = canonical_form(graph2, use_labels)
     return canonical1 == canonical2
 
 
 if __name__ == "__main__":
     graph1 = load_graph_from_json('graphs/graph.json')
     graph2 = load_graph_from_json('graphs/el_graph.json')
-    
+
     is_isomorphic = bliss_isomorphism(graph1, graph2)
     print("Graphs are isomorphic" if is_isomorphic else "Graphs are not isomorphic")
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+from algos.csr_graph import CSRGraph
+from algos.binary_graph import EXTENSION, load_binary_graph, map_graph_file
+from algos.bliss import CANONICAL_VERSION, canonical_labeling
+from algos.fingerprint import FINGERPRINT_VERSION, GraphFingerprint, values_from_json, values_to_json
+from algos.instrument import count
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'isographchecker', 'cache.sqlite')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# A hit only rewrites last_used once it is this many seconds old, so that
+# repeated hits stay read-only; eviction order only needs to be coarse
+LAST_USED_RESOLUTION = 60.0
+# Stored as the database's user_version; entries written under another
+# layout are dropped on open. Layout 1 pickled its values, layout 2 stores
+# certificates as raw bytes and fingerprints as JSON.
+CACHE_LAYOUT = 2
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    content_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    content_hash TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (content_hash, kind, version)
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+'''
+
+
+class GraphCache:
+    # Fingerprints and canonical certificates stored in SQLite, keyed by the
+    # content hash of the graph file plus the algorithm version. A changed
+    # file gets a new content hash, so stale entries are never returned and
+    # age out through the size-bounded LRU eviction.
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            # Readers in other processes then do not block on a writer
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(_SCHEMA)
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] != CACHE_LAYOUT:
+            with self.connection:
+                self.connection.execute('DELETE FROM entries')
+                self.connection.execute(f'PRAGMA user_version = {CACHE_LAYOUT}')
+
+    def close(self):
+        self.connection.close()
+
+    def content_hash(self, file_path):
+        return self._hash_file(file_path)[0]
+
+    def _hash_file(self, file_path):
+        # (content hash, contents). The (mtime, size) index lets a known,
+        # unchanged file skip reading and hashing, and the contents are then
+        # None; otherwise they are returned so that a cache miss parses the
+        # bytes that were hashed instead of reading the file again.
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        row = self.connection.execute(
+            'SELECT content_hash FROM files WHERE path = ? AND mtime_ns = ? AND size = ?',
+            (file_path, stat.st_mtime_ns, stat.st_size)).fetchone()
+        if row is not None:
+            return row[0], None
+        data = self._read(file_path)
+        content_hash = hashlib.blake2b(data, digest_size=20).hexdigest()
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                                    (file_path, stat.st_mtime_ns, stat.st_size, content_hash))
+        return content_hash, data
+
+    def get(self, content_hash, kind, version):
+        # Values are bytes; callers encode and decode them
+        row = self.connection.execute(
+            'SELECT value, last_used FROM entries WHERE content_hash = ? AND kind = ? AND version = ?',
+            (content_hash, kind, version)).fetchone()
+        if row is None:
+            self.misses += 1
+            count('cache misses')
+            return None
+        self.hits += 1
+        count('cache hits')
+        now = time.time()
+        if now - row[1] >= LAST_USED_RESOLUTION:
+            with self.connection:
+                self.connection.execute(
+                    'UPDATE entries SET last_used = ? WHERE content_hash = ? AND kind = ? AND version = ?',
+                    (now, content_hash, kind, version))
+        return bytes(row[0])
+
+    def put(self, content_hash, kind, version, value):
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                                    (content_hash, kind, version, value, len(value), time.time()))
+            self._evict()
+
+    def _evict(self):
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute(
+            'SELECT rowid, size FROM entries ORDER BY last_used').fetchall()
+        evicted = []
+        for rowid, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((rowid,))
+            total -= size
+        self.connection.executemany('DELETE FROM entries WHERE rowid = ?', evicted)
+        # Index rows of files whose entries are all gone go with them, so the
+        # files table stays bounded by the entries
+        self.connection.execute('DELETE FROM files WHERE content_hash NOT IN (SELECT content_hash FROM entries)')
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute('DELETE FROM entries')
+            self.connection.execute('DELETE FROM files')
+
+    @staticmethod
+    def _read(file_path):
+        # Binary graphs are mapped rather than read, so hashing and parsing
+        # share one mapping and the parsed arrays view it without a copy
+        if file_path.endswith(EXTENSION):
+            return map_graph_file(file_path)
+        with open(file_path, 'rb') as file:
+            return file.read()
+
+    def _parse(self, file_path, data):
+        if data is None:
+            data = self._read(file_path)
+        if file_path.endswith(EXTENSION):
+            return load_binary_graph(file_path, data)
+        return CSRGraph.from_json_data(json.loads(data))
+
+    def fingerprint(self, file_path, graph=None, use_labels=True):
+        kind = 'fingerprint' if use_labels else 'fingerprint-unlabelled'
+        content_hash, contents = self._hash_file(file_path)
+        data = self.get(content_hash, kind, FINGERPRINT_VERSION)
+        if data is not None:
+            return GraphFingerprint.from_values(values_from_json(json.loads(data)))
+        if graph is None:
+            graph = self._parse(file_path, contents)
+        values = GraphFingerprint(graph, use_labels=use_labels).compute_all().values
+        self.put(content_hash, kind, FINGERPRINT_VERSION, json.dumps(values_to_json(values)).encode('utf-8'))
+        return GraphFingerprint.from_values(values)
+
+    def certificate(self, file_path, graph=None, use_labels=True):
+        kind = 'certificate' if use_labels else 'certificate-unlabelled'
+        content_hash, contents = self._hash_file(file_path)
+        certificate = self.get(content_hash, kind, CANONICAL_VERSION)
+        if certificate is None:
+            if graph is None:
+                graph = self._parse(file_path, contents)
+            certificate = canonical_labeling(graph, use_labels)[1]
+            self.put(content_hash, kind, CANONICAL_VERSION, certificate)
+        return certificate
+
+
+_default_cache = None
+
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = GraphCache()
+    return _default_cache
+
+
+def cached_isomorphism(file_path1, file_path2, cache=None, use_labels=True):
+    cache = default_cache() if cache is None else cache
+    fingerprint1 = cache.fingerprint(file_path1, use_labels=use_labels)
+    if not fingerprint1.matches(cache.fingerprint(file_path2, use_labels=use_labels)):
+        return False
+    return cache.certificate(file_path1, use_labels=use_labels) == cache.certificate(file_path2, use_labels=use_labels)
+
+
+if __name__ == "__main__":
+    is_isomorphic = cached_isomorphism('graphs/graph.json', 'graphs/el_graph.json')
+    print("Graphs are isomorphic" if is_isomorphic else "Graphs are not isomorphic")
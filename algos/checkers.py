@@ -0,0 +1,27 @@
+from algos.vf2 import vf2_isomorphism, vf2_mapping
+from algos.bliss import bliss_isomorphism, bliss_mapping
+from algos.fingerprint import fingerprint_isomorphism, fingerprint_mapping
+from algos.color_refinement import color_refinement_isomorphism, color_refinement_mapping
+from algos.weisfeiler_lehman import weisfeiler_lehman_isomorphism, weisfeiler_lehman_mapping
+from algos.laszlo_babai_simplified import laszlo_babai_simplified_isomorphism, laszlo_babai_simplified_mapping
+
+
+CHECKERS = {
+    'vf2': vf2_isomorphism,
+    'bliss': bliss_isomorphism,
+    'color_refinement': color_refinement_isomorphism,
+    'weisfeiler_lehman': weisfeiler_lehman_isomorphism,
+    'laszlo_babai': laszlo_babai_simplified_isomorphism,
+    'fingerprint': fingerprint_isomorphism,
+}
+
+# Same keys; each returns a dict from graph1 node ids to graph2 node ids, or
+# None when the graphs are not isomorphic
+MAPPINGS = {
+    'vf2': vf2_mapping,
+    'bliss': bliss_mapping,
+    'color_refinement': color_refinement_mapping,
+    'weisfeiler_lehman': weisfeiler_lehman_mapping,
+    'laszlo_babai': laszlo_babai_simplified_mapping,
+    'fingerprint': fingerprint_mapping,
+}
@@ -1,43 +1,13 @@
-import json
-import networkx as nx
-from collections import defaultdict
+from algos.csr_graph import load_graph_from_json
+from algos.mapping import refinement_mapping
+from algos.refinement import refinement_hash, refinement_isomorphism, stable_refinement_isomorphism
 
 
-def load_graph_from_json(file_path):
-    with open(file_path, 'r') as file:
-        data = json.load(file)
-    G = nx.Graph()
-    for node in data['nodes']:
-        G.add_node(node['id'], label=node['label'])
-    for edge in data['edges']:
-        G.add_edge(edge['source'], edge['target'])
-    return G
-
-
-def get_node_labels(graph):
-    labels = nx.get_node_attributes(graph, 'label')
-    return {node: labels[node] for node in graph.nodes()}
-
-
-def color_refinement_hash(graph, iterations):
-    labels = get_node_labels(graph)
-    for _ in range(iterations):
-        new_labels = {}
-        for node in graph.nodes():
-            neighbor_labels = sorted(labels[neighbor] for neighbor in graph.neighbors(node))
-            new_labels[node] = labels[node] + ''.join(str(label) for label in neighbor_labels)
-        label_map = defaultdict(int)
-        for label in new_labels.values():
-            label_map[label] += 1
-        new_label_map = {label: str(i) for i, label in enumerate(sorted(label_map.keys()))}
-        labels = {node: new_label_map[label] for node, label in new_labels.items()}
-    return set(labels.values())
-
-
-def color_refinement_isomorphism(graph1, graph2, iterations=3):
-    hash1 = color_refinement_hash(graph1, iterations)
-    hash2 = color_refinement_hash(graph2, iterations)
-    return hash1 == hash2
+# Thin aliases; the implementation is shared in algos.refinement.
+color_refinement_hash = refinement_hash
+color_refinement_stable_isomorphism = stable_refinement_isomorphism
+color_refinement_isomorphism = refinement_isomorphism
+color_refinement_mapping = refinement_mapping
 
 
 if __name__ == "__main__":
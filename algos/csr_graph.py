@@ -0,0 +1,293 @@
+import numpy as np
+
+from algos.instrument import phase
+
+
+# Edge directions as seen from the row a CSR slot belongs to
+UNDIRECTED, OUT, IN = '-', '>', '<'
+_DIRECTIONS = (UNDIRECTED, OUT, IN)
+
+# Edge color of a single unlabelled undirected edge, the only kind of edge
+# a graph without edge_colors has
+PLAIN_EDGE = ((UNDIRECTED, ''),)
+
+
+class CSRGraph:
+    # Graph with nodes relabelled to 0..n-1, adjacency stored as CSR arrays
+    # (neighbors of v are indices[indptr[v]:indptr[v + 1]], sorted and
+    # distinct) and node labels interned into an int32 array indexing
+    # label_names.
+    #
+    # Directed, edge-labelled and parallel edges are folded into edge_colors,
+    # an int32 code per CSR slot indexing edge_color_names. The name of slot
+    # (u, v) is the sorted tuple of (direction, edge label) parts of every
+    # edge between u and v, seen from u: ('>', 'a') for an edge u -> v
+    # labelled 'a', ('<', 'a') for v -> u and ('-', 'a') for an undirected
+    # one, repeated for parallel edges. The adjacency itself stays that of
+    # the underlying simple undirected graph. edge_colors is None when every
+    # edge is PLAIN_EDGE, which keeps plain graphs on the original code paths.
+    def __init__(self, node_ids, labels, label_names, indptr, indices, edge_colors=None, edge_color_names=None,
+                 directed=False, multigraph=False):
+        self.node_ids = node_ids
+        self.labels = labels
+        self.label_names = label_names
+        self.indptr = indptr
+        self.indices = indices
+        self.edge_colors = edge_colors
+        self.edge_color_names = edge_color_names
+        self.directed = directed
+        self.multigraph = multigraph
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self):
+        # Adjacent node pairs; parallel and antiparallel edges count once
+        loops = int(np.count_nonzero(self.indices == self.edge_sources()))
+        return (len(self.indices) + loops) // 2
+
+    def degrees(self):
+        return np.diff(self.indptr)
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def edge_sources(self):
+        return np.repeat(np.arange(self.num_nodes, dtype=np.int32), self.degrees())
+
+    def edges(self):
+        sources = self.edge_sources()
+        mask = sources <= self.indices
+        return sources[mask], self.indices[mask]
+
+    def node_id_list(self):
+        if isinstance(self.node_ids, np.ndarray):
+            return self.node_ids.tolist()
+        return list(self.node_ids)
+
+    def node_labels(self):
+        return [self.label_names[label] for label in self.labels]
+
+    def edge_color_codes(self):
+        # (codes, names) with a PLAIN_EDGE table for plain graphs
+        if self.edge_colors is None:
+            return np.zeros(len(self.indices), dtype=np.int32), [PLAIN_EDGE]
+        return self.edge_colors, self.edge_color_names
+
+    def reverse_edge_colors(self):
+        # reversed[c] is the code of color c seen from the other endpoint,
+        # i.e. the color of slot (v, u) when slot (u, v) has color c
+        return reverse_edge_color_table(self.edge_color_codes()[1])
+
+    def edge_list(self):
+        # The original edges as (sources, targets, labels) lists, parallel
+        # edges repeated; undirected edges are listed once with source <= target
+        sources = []
+        targets = []
+        edge_labels = []
+        if self.edge_colors is None:
+            edge_sources, edge_targets = self.edges()
+            return edge_sources.tolist(), edge_targets.tolist(), [''] * len(edge_sources)
+        names = self.edge_color_names
+        for source, target, code in zip(self.edge_sources().tolist(), self.indices.tolist(), self.edge_colors.tolist()):
+            for direction, label in names[code]:
+                if direction == OUT or direction == UNDIRECTED and source <= target:
+                    sources.append(source)
+                    targets.append(target)
+                    edge_labels.append(label)
+        return sources, targets, edge_labels
+
+    @classmethod
+    def from_edges(cls, node_ids, node_labels, sources, targets, edge_labels=None, directed=False, multigraph=False):
+        node_ids = list(node_ids)
+        label_index = {}
+        labels = np.fromiter((label_index.setdefault(label, len(label_index)) for label in node_labels),
+                             dtype=np.int32, count=len(node_ids))
+        edge_label_names = None
+        if edge_labels is not None:
+            edge_label_index = {}
+            edge_labels = np.fromiter((edge_label_index.setdefault(label, len(edge_label_index))
+                                       for label in edge_labels), dtype=np.int32, count=len(sources))
+            edge_label_names = list(edge_label_index)
+        return cls.from_arrays(node_ids, labels, list(label_index), sources, targets, edge_labels, edge_label_names,
+                               directed, multigraph)
+
+    @classmethod
+    def from_arrays(cls, node_ids, labels, label_names, sources, targets, edge_labels=None, edge_label_names=None,
+                    directed=False, multigraph=False):
+        # node_ids may be a list or an integer array; labels are already
+        # interned codes into label_names, edge_labels into edge_label_names.
+        # Repeated edges are only kept apart for a multigraph.
+        num_nodes = len(node_ids)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        if edge_labels is not None and all(name == '' for name in edge_label_names):
+            edge_labels = None
+        if edge_labels is not None or directed or multigraph:
+            return cls._from_colored_arrays(node_ids, labels, label_names, sources, targets, edge_labels,
+                                            edge_label_names, directed, multigraph)
+        # Sorted and deduplicated by hand: np.unique may take a much slower
+        # hash-based path for plain integer arrays.
+        keys = np.concatenate((sources * num_nodes + targets, targets * num_nodes + sources))
+        keys.sort()
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))] if len(keys) else keys
+        return cls(node_ids, labels, label_names, *_csr_rows(keys, num_nodes))
+
+    @classmethod
+    def _from_colored_arrays(cls, node_ids, labels, label_names, sources, targets, edge_labels, edge_label_names,
+                             directed, multigraph):
+        num_nodes = len(node_ids)
+        if edge_labels is None:
+            edge_labels = np.zeros(len(sources), dtype=np.int64)
+            edge_label_names = ['']
+        # Every edge becomes a part code (label * 3 + direction) in the slot
+        # of each endpoint; an undirected loop only once
+        edge_labels = np.asarray(edge_labels, dtype=np.int64) * 3
+        if directed:
+            slot_sources = np.concatenate((sources, targets))
+            slot_targets = np.concatenate((targets, sources))
+            parts = np.concatenate((edge_labels + 1, edge_labels + 2))
+        else:
+            other = sources != targets
+            slot_sources = np.concatenate((sources, targets[other]))
+            slot_targets = np.concatenate((targets, sources[other]))
+            parts = np.concatenate((edge_labels, edge_labels[other]))
+        num_parts = 3 * len(edge_label_names)
+        keys = (slot_sources * num_nodes + slot_targets) * num_parts + parts
+        keys.sort()
+        if not multigraph and len(keys):
+            keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+        slot_keys = keys // num_parts
+        parts = keys % num_parts
+        starts = np.flatnonzero(np.concatenate(([True], slot_keys[1:] != slot_keys[:-1]))) if len(keys) else keys
+        sizes = np.diff(np.append(starts, len(keys)))
+
+        def name(part_codes):
+            return tuple(sorted(((_DIRECTIONS[part % 3], edge_label_names[part // 3]) for part in part_codes),
+                                key=lambda item: (item[0], str(item[1]))))
+
+        # Slots with one edge, nearly all of them, are named per distinct
+        # part; the rest one by one
+        name_index = {}
+        edge_colors = np.empty(len(starts), dtype=np.int32)
+        single = sizes == 1
+        single_parts, inverse = np.unique(parts[starts[single]], return_inverse=True)
+        single_codes = np.array([name_index.setdefault(name((part,)), len(name_index))
+                                 for part in single_parts.tolist()], dtype=np.int32)
+        edge_colors[single] = single_codes[inverse.reshape(-1)]
+        parts = parts.tolist()
+        for slot in np.flatnonzero(~single).tolist():
+            start = int(starts[slot])
+            edge_colors[slot] = name_index.setdefault(name(parts[start:start + int(sizes[slot])]), len(name_index))
+        edge_color_names = list(name_index)
+        if edge_color_names == [PLAIN_EDGE] or not edge_color_names:
+            edge_colors = edge_color_names = None
+        return cls(node_ids, labels, label_names, *_csr_rows(slot_keys[starts], num_nodes),
+                   edge_colors=edge_colors, edge_color_names=edge_color_names, directed=directed,
+                   multigraph=multigraph)
+
+    @classmethod
+    def from_json_data(cls, data):
+        # Node-link JSON: 'nodes' and 'edges' (or networkx's 'links'); an
+        # edge's 'label' and the top-level 'directed' and 'multigraph' flags
+        # are optional
+        node_index = {}
+        node_labels = []
+        for node in data['nodes']:
+            node_index[node['id']] = len(node_index)
+            node_labels.append(node['label'])
+        sources = []
+        targets = []
+        edge_labels = []
+        for edge in data['edges'] if 'edges' in data else data.get('links', ()):
+            for endpoint, side in ((edge['source'], sources), (edge['target'], targets)):
+                if endpoint not in node_index:
+                    node_index[endpoint] = len(node_index)
+                    node_labels.append('')
+                side.append(node_index[endpoint])
+            edge_labels.append(edge.get('label', ''))
+        return cls.from_edges(node_index, node_labels, sources, targets, edge_labels,
+                              bool(data.get('directed', False)), bool(data.get('multigraph', False)))
+
+    @classmethod
+    def from_networkx(cls, graph):
+        node_index = {node: i for i, node in enumerate(graph.nodes())}
+        node_labels = [graph.nodes[node].get('label', '') for node in graph.nodes()]
+        edges = list(graph.edges(data='label', default=''))
+        sources = [node_index[u] for u, _, _ in edges]
+        targets = [node_index[v] for _, v, _ in edges]
+        return cls.from_edges(node_index, node_labels, sources, targets, [label for _, _, label in edges],
+                              graph.is_directed(), graph.is_multigraph())
+
+    def to_networkx(self):
+        import networkx as nx
+        if self.directed:
+            graph = nx.MultiDiGraph() if self.multigraph else nx.DiGraph()
+        else:
+            graph = nx.MultiGraph() if self.multigraph else nx.Graph()
+        node_ids = self.node_id_list()
+        for node_id, label in zip(node_ids, self.node_labels()):
+            graph.add_node(node_id, label=label)
+        for source, target, label in zip(*self.edge_list()):
+            if label == '':
+                graph.add_edge(node_ids[source], node_ids[target])
+            else:
+                graph.add_edge(node_ids[source], node_ids[target], label=label)
+        return graph
+
+
+def _csr_rows(keys, num_nodes):
+    # indptr and indices of sorted, distinct row * num_nodes + column keys
+    rows = (keys // num_nodes).astype(np.int32)
+    indices = (keys % num_nodes).astype(np.int32)
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=num_nodes), out=indptr[1:])
+    return indptr, indices
+
+
+def reverse_edge_color_table(names):
+    index = {name: i for i, name in enumerate(names)}
+    flipped = {UNDIRECTED: UNDIRECTED, OUT: IN, IN: OUT}
+    return np.array([index[tuple(sorted(((flipped[direction], label) for direction, label in name),
+                                        key=lambda item: (item[0], str(item[1]))))]
+                     for name in names], dtype=np.int32)
+
+
+def as_csr_graph(graph):
+    if isinstance(graph, CSRGraph):
+        return graph
+    return CSRGraph.from_networkx(graph)
+
+
+def load_graph_from_json(file_path):
+    from algos.json_stream import stream_graph_from_json
+    with phase('load'):
+        return stream_graph_from_json(file_path)
+
+
+def disjoint_union(graph1, graph2):
+    offset = len(graph1.indices)
+    label_index = {name: i for i, name in enumerate(graph1.label_names)}
+    for name in graph2.label_names:
+        label_index.setdefault(name, len(label_index))
+    label_codes2 = np.array([label_index[name] for name in graph2.label_names], dtype=np.int32)
+    edge_colors = edge_color_names = None
+    if graph1.edge_colors is not None or graph2.edge_colors is not None:
+        colors1, names1 = graph1.edge_color_codes()
+        colors2, names2 = graph2.edge_color_codes()
+        name_index = {name: i for i, name in enumerate(names1)}
+        for name in names2:
+            name_index.setdefault(name, len(name_index))
+        codes2 = np.array([name_index[name] for name in names2], dtype=np.int32)
+        edge_colors = np.concatenate((colors1, codes2[colors2]))
+        edge_color_names = list(name_index)
+    return CSRGraph(
+        [(0, node_id) for node_id in graph1.node_id_list()] + [(1, node_id) for node_id in graph2.node_id_list()],
+        np.concatenate((graph1.labels, label_codes2[graph2.labels])),
+        list(label_index),
+        np.concatenate((graph1.indptr, graph2.indptr[1:] + offset)),
+        np.concatenate((graph1.indices, graph2.indices + graph1.num_nodes)),
+        edge_colors, edge_color_names, graph1.directed or graph2.directed, graph1.multigraph or graph2.multigraph,
+    )
@@ -0,0 +1,216 @@
+import hashlib
+import numpy as np
+
+from timeit import default_timer as timer
+
+from algos.csr_graph import as_csr_graph, load_graph_from_json
+from algos.instrument import observe, phase
+from algos.mapping import certified_mapping
+from algos.progress import report
+from algos.refinement import edge_hashes, label_hashes, signature_hashes
+
+
+# Bump when a stage changes so that cached fingerprints are recomputed
+FINGERPRINT_VERSION = 2
+
+# Ordered from cheapest to most expensive
+STAGES = ('size', 'labels', 'edges', 'degrees', 'triangles', 'refinement')
+
+
+def _digest(values):
+    return hashlib.blake2b(np.ascontiguousarray(values).tobytes(), digest_size=16).digest()
+
+
+def triangle_counts(graph):
+    # Orient every edge from lower to higher (degree, id) rank, pair up the
+    # forward neighbors of each node and look the closing edge up in the
+    # sorted CSR edge keys.
+    num_nodes = graph.num_nodes
+    degrees = graph.degrees()
+    rank = np.empty(num_nodes, dtype=np.int64)
+    rank[np.lexsort((np.arange(num_nodes), degrees))] = np.arange(num_nodes)
+    sources = graph.edge_sources().astype(np.int64)
+    targets = graph.indices.astype(np.int64)
+    forward = rank[sources] < rank[targets]
+    sources = sources[forward]
+    targets = targets[forward]
+
+    forward_degrees = np.bincount(sources, minlength=num_nodes)
+    row_starts = np.cumsum(forward_degrees) - forward_degrees
+    positions = np.arange(len(sources)) - row_starts[sources]
+    pair_counts = forward_degrees[sources] - positions - 1
+    first = np.repeat(np.arange(len(sources)), pair_counts)
+    pair_starts = np.cumsum(pair_counts) - pair_counts
+    second = first + 1 + np.arange(len(first)) - np.repeat(pair_starts, pair_counts)
+
+    edge_keys = graph.edge_sources().astype(np.int64) * num_nodes + graph.indices
+    wedge_keys = targets[first] * num_nodes + targets[second]
+    slots = np.minimum(np.searchsorted(edge_keys, wedge_keys), max(len(edge_keys) - 1, 0))
+    closed = edge_keys[slots] == wedge_keys if len(edge_keys) else np.zeros(0, dtype=bool)
+
+    corners = np.concatenate((sources[first[closed]], targets[first[closed]], targets[second[closed]]))
+    return np.bincount(corners, minlength=num_nodes)
+
+
+class StageStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.computed = dict.fromkeys(STAGES, 0)
+        self.compared = dict.fromkeys(STAGES, 0)
+        self.rejected = dict.fromkeys(STAGES, 0)
+
+    def rejection_rate(self, stage):
+        return self.rejected[stage] / self.compared[stage] if self.compared[stage] else 0.0
+
+    def report(self):
+        return {
+            stage: {
+                'seconds': self.seconds[stage],
+                'computed': self.computed[stage],
+                'compared': self.compared[stage],
+                'rejected': self.rejected[stage],
+                'rejection_rate': self.rejection_rate(stage),
+            }
+            for stage in STAGES
+        }
+
+
+stage_stats = StageStats()
+
+
+class GraphFingerprint:
+    # Staged isomorphism invariants of one graph. Every stage is computed on
+    # first use, so comparing two fingerprints only pays for the stages it
+    # gets to before they differ.
+    def __init__(self, graph, stats=None, max_rounds=None, use_labels=True):
+        self.graph = None if graph is None else as_csr_graph(graph)
+        self.stats = stage_stats if stats is None else stats
+        self.max_rounds = max_rounds
+        self.use_labels = use_labels
+        self.values = {}
+
+    @classmethod
+    def from_values(cls, values, stats=None):
+        fingerprint = cls(None, stats)
+        fingerprint.values = dict(values)
+        return fingerprint
+
+    def stage(self, name):
+        if name not in self.values:
+            start_time = timer()
+            with phase('invariants'), phase(name):
+                self.values[name] = getattr(self, '_compute_' + name)()
+            self.stats.seconds[name] += timer() - start_time
+            self.stats.computed[name] += 1
+        return self.values[name]
+
+    def compute_all(self):
+        for name in STAGES:
+            self.stage(name)
+        return self
+
+    def key(self):
+        return tuple(self.stage(name) for name in STAGES)
+
+    def first_difference(self, other):
+        for name in STAGES:
+            self.stats.compared[name] += 1
+            if self.stage(name) != other.stage(name):
+                self.stats.rejected[name] += 1
+                return name
+        return None
+
+    def matches(self, other):
+        return self.first_difference(other) is None
+
+    def _compute_size(self):
+        return self.graph.num_nodes, self.graph.num_edges
+
+    def _node_hashes(self):
+        if self.use_labels:
+            return label_hashes(self.graph)
+        return np.zeros(self.graph.num_nodes, dtype=np.uint64)
+
+    def _compute_labels(self):
+        return _digest(np.sort(self._node_hashes()))
+
+    def _compute_edges(self):
+        # Multiset of edge colors over the CSR slots; all zero when plain
+        hashes = edge_hashes(self.graph)
+        if hashes is None:
+            return _digest(np.zeros(len(self.graph.indices), dtype=np.uint64))
+        return _digest(np.sort(hashes))
+
+    def _compute_degrees(self):
+        return _digest(np.sort(self.graph.degrees()))
+
+    def _compute_triangles(self):
+        return _digest(np.sort(triangle_counts(self.graph)))
+
+    def _compute_refinement(self):
+        # Colors stay full-width hashes instead of being compressed, so the
+        # per-round histograms are comparable between graphs.
+        colors = self._node_hashes()
+        num_colors = len(np.unique(colors))
+        digests = [_digest(np.sort(colors))]
+        while self.max_rounds is None or len(digests) <= self.max_rounds:
+            with phase('refinement round'):
+                colors = signature_hashes(self.graph, colors)
+                digests.append(_digest(np.sort(colors)))
+            report('refinement round', len(digests) - 1)
+            new_num_colors = len(np.unique(colors))
+            observe('partition cells', new_num_colors)
+            if new_num_colors == num_colors:
+                break
+            num_colors = new_num_colors
+        return tuple(digests)
+
+
+def values_to_json(values):
+    # Computed stage values as a JSON-compatible dict, digests as hex
+    data = {}
+    for name, value in values.items():
+        if name == 'size':
+            data[name] = list(value)
+        elif name == 'refinement':
+            data[name] = [digest.hex() for digest in value]
+        else:
+            data[name] = value.hex()
+    return data
+
+
+def values_from_json(data):
+    # Inverse of values_to_json; unknown stages are dropped
+    values = {}
+    for name, value in data.items():
+        if name == 'size':
+            values[name] = tuple(int(number) for number in value)
+        elif name == 'refinement':
+            values[name] = tuple(bytes.fromhex(digest) for digest in value)
+        elif name in STAGES:
+            values[name] = bytes.fromhex(value)
+    return values
+
+
+def fingerprint_isomorphism(graph1, graph2, use_labels=True):
+    fingerprint1 = GraphFingerprint(graph1, use_labels=use_labels)
+    return fingerprint1.matches(GraphFingerprint(graph2, use_labels=use_labels))
+
+
+def fingerprint_mapping(graph1, graph2, use_labels=True):
+    # Matching fingerprints are only evidence; the mapping certifies them.
+    if not fingerprint_isomorphism(graph1, graph2, use_labels):
+        return None
+    return certified_mapping(graph1, graph2, use_labels)
+
+
+if __name__ == "__main__":
+    graph1 = load_graph_from_json('graphs/graph.json')
+    graph2 = load_graph_from_json('graphs/el_graph.json')
+
+    is_isomorphic = fingerprint_isomorphism(graph1, graph2)
+    print("Graphs are isomorphic" if is_isomorphic else "Graphs are not isomorphic")
+    print(stage_stats.report())
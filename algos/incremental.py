@@ -0,0 +1,230 @@
+import numpy as np
+
+from algos.csr_graph import CSRGraph, as_csr_graph, load_graph_from_json
+from algos.refinement import hash_histogram, label_hashes, label_name_hashes, multiset_hash, neighborhood_hashes, signature_hashes
+
+
+DEFAULT_ROUNDS = 3
+
+_HASH_MODULUS = 1 << 64
+
+
+class IncrementalGraph:
+    # A graph edited in place by node and edge deltas, together with
+    # `rounds` refinement rounds of full-width node hashes (comparable across
+    # graphs, like the fingerprint's refinement stage) and an additive
+    # multiset hash of every round. Round r of a node only depends on round
+    # r - 1 of the node and its neighbors, so after an edit round r is
+    # recomputed just for the edited nodes and the neighbors of nodes whose
+    # round r - 1 hash changed: the work grows with the k-hop neighborhood of
+    # the edit, not with the graph.
+    #
+    # Edits are kept in an adjacency overlay on top of the original CSR
+    # arrays; removed nodes keep their index and are only marked dead.
+    def __init__(self, graph, rounds=DEFAULT_ROUNDS, use_labels=True):
+        graph = as_csr_graph(graph)
+        if graph.edge_colors is not None:
+            raise ValueError('IncrementalGraph only tracks undirected graphs without edge labels or parallel edges')
+        self.graph = graph
+        self.rounds = rounds
+        self.use_labels = use_labels
+        self.node_ids = graph.node_id_list()
+        self.node_index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.node_labels = graph.node_labels()
+        self.alive = np.ones(graph.num_nodes, dtype=bool)
+        self.overlay = {}
+        self.edge_count = graph.num_edges
+        self.recomputed = 0
+        colors = label_hashes(graph) if use_labels else np.zeros(graph.num_nodes, dtype=np.uint64)
+        self.hashes = [colors]
+        for _ in range(rounds):
+            colors = signature_hashes(graph, colors)
+            self.hashes.append(colors)
+        self.sums = [multiset_hash(colors) for colors in self.hashes]
+
+    @property
+    def num_nodes(self):
+        return len(self.node_index)
+
+    def neighbors(self, node):
+        if node in self.overlay:
+            return self.overlay[node]
+        if node < self.graph.num_nodes:
+            return self.graph.neighbors(node).tolist()
+        return ()
+
+    def _editable_neighbors(self, node):
+        if node not in self.overlay:
+            self.overlay[node] = set(self.neighbors(node))
+        return self.overlay[node]
+
+    def _index(self, node_id):
+        if node_id not in self.node_index:
+            raise ValueError(f'unknown node {node_id!r}')
+        return self.node_index[node_id]
+
+    def apply_delta(self, delta):
+        # delta uses the graph JSON layout: 'add_nodes' lists {'id', 'label'}
+        # objects, 'remove_nodes' lists node ids and 'add_edges' and
+        # 'remove_edges' list {'source', 'target'} objects. Nodes are added
+        # first and removed last, so one delta may wire up a new node or
+        # unwire a removed one. Removing a missing edge does nothing.
+        add_nodes = delta.get('add_nodes', ())
+        remove_nodes = delta.get('remove_nodes', ())
+        # Validated up front so that a bad delta leaves the graph untouched
+        new_ids = set()
+        for node in add_nodes:
+            if node['id'] in self.node_index or node['id'] in new_ids:
+                raise ValueError(f'node {node["id"]!r} already exists')
+            new_ids.add(node['id'])
+        for edge in list(delta.get('add_edges', ())) + list(delta.get('remove_edges', ())):
+            for endpoint in (edge['source'], edge['target']):
+                if endpoint not in self.node_index and endpoint not in new_ids:
+                    raise ValueError(f'unknown node {endpoint!r}')
+        for node_id in remove_nodes:
+            if node_id not in self.node_index:
+                raise ValueError(f'unknown node {node_id!r}')
+
+        added = []
+        for node in add_nodes:
+            added.append(self._append_node(node['id'], node.get('label', '')))
+        edited = set(added)
+        for edge, adding in ([(edge, True) for edge in delta.get('add_edges', ())] +
+                             [(edge, False) for edge in delta.get('remove_edges', ())]):
+            source, target = self._index(edge['source']), self._index(edge['target'])
+            present = target in self._editable_neighbors(source)
+            if adding and not present:
+                self._editable_neighbors(source).add(target)
+                self._editable_neighbors(target).add(source)
+                self.edge_count += 1
+            elif present and not adding:
+                self._editable_neighbors(source).discard(target)
+                self._editable_neighbors(target).discard(source)
+                self.edge_count -= 1
+            edited.update((source, target))
+        removed = []
+        for node_id in remove_nodes:
+            node = self.node_index.pop(node_id)
+            self.edge_count -= len(self.neighbors(node))
+            for neighbor in list(self.neighbors(node)):
+                self._editable_neighbors(neighbor).discard(node)
+                edited.add(neighbor)
+            self.overlay[node] = set()
+            self.alive[node] = False
+            removed.append(node)
+        self._update(added, removed, edited)
+        return self
+
+    def add_node(self, node_id, label=''):
+        return self.apply_delta({'add_nodes': [{'id': node_id, 'label': label}]})
+
+    def remove_node(self, node_id):
+        return self.apply_delta({'remove_nodes': [node_id]})
+
+    def add_edge(self, source, target):
+        return self.apply_delta({'add_edges': [{'source': source, 'target': target}]})
+
+    def remove_edge(self, source, target):
+        return self.apply_delta({'remove_edges': [{'source': source, 'target': target}]})
+
+    def _append_node(self, node_id, label):
+        node = len(self.node_ids)
+        if node == len(self.alive):
+            # Grow the per-node arrays geometrically
+            capacity = max(2 * node, 16)
+            self.alive = np.concatenate((self.alive, np.zeros(capacity - node, dtype=bool)))
+            self.hashes = [np.concatenate((colors, np.zeros(capacity - node, dtype=np.uint64)))
+                           for colors in self.hashes]
+        self.node_ids.append(node_id)
+        self.node_labels.append(label)
+        self.node_index[node_id] = node
+        self.alive[node] = True
+        self.overlay[node] = set()
+        return node
+
+    def _update(self, added, removed, edited):
+        # Dead nodes leave every round's multiset; new nodes join round 0
+        # here and the later rounds below, like any other changed node.
+        removed = np.array(removed, dtype=np.int64)
+        for round_number, colors in enumerate(self.hashes):
+            self.sums[round_number] -= multiset_hash(colors[removed])
+        added = np.array(added, dtype=np.int64)
+        if len(added) and self.use_labels:
+            self.hashes[0][added] = label_name_hashes([self.node_labels[node] for node in added.tolist()])
+        self.sums[0] += multiset_hash(self.hashes[0][added])
+        changed = set(added.tolist())
+        edited = {node for node in edited if self.alive[node]}
+        new_nodes = set(changed)
+        self.recomputed = 0
+        for round_number in range(1, self.rounds + 1):
+            affected = set(edited) | changed
+            for node in changed:
+                affected.update(self.neighbors(node))
+            affected = np.fromiter(sorted(affected), dtype=np.int64, count=len(affected))
+            if len(affected) == 0:
+                break
+            rows = [self.neighbors(node) for node in affected.tolist()]
+            indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+            np.cumsum([len(row) for row in rows], out=indptr[1:])
+            neighbors = np.fromiter((neighbor for row in rows for neighbor in row), dtype=np.int64,
+                                    count=int(indptr[-1]))
+            previous = self.hashes[round_number - 1]
+            colors = self.hashes[round_number]
+            new_colors = neighborhood_hashes(previous[affected], previous[neighbors], indptr)
+            is_new = np.fromiter((node in new_nodes for node in affected.tolist()), dtype=bool, count=len(affected))
+            old_colors = colors[affected]
+            differs = is_new | (new_colors != old_colors)
+            self.sums[round_number] += multiset_hash(new_colors[differs]) - multiset_hash(old_colors[differs & ~is_new])
+            colors[affected] = new_colors
+            changed = set(affected[differs].tolist())
+            self.recomputed += len(affected)
+        self.sums = [value % _HASH_MODULUS for value in self.sums]
+
+    @property
+    def num_edges(self):
+        return self.edge_count
+
+    def digest(self):
+        # Node and edge counts plus the multiset hash of every round; equal
+        # for isomorphic graphs
+        return (self.num_nodes, self.num_edges, tuple(self.sums))
+
+    def matches(self, other):
+        return self.digest() == other.digest()
+
+    def weisfeiler_lehman_hash(self):
+        # The last round's hash histogram, as weisfeiler_lehman_hash gives
+        # for to_graph() with iterations=rounds
+        return hash_histogram(self.hashes[-1][:len(self.node_ids)][self.alive[:len(self.node_ids)]])
+
+    def to_graph(self):
+        # The edited graph as a fresh CSRGraph, e.g. to run a full checker or
+        # certify a mapping after a run of cheap incremental checks
+        num_nodes = len(self.node_ids)
+        graph = self.graph
+        keep = np.ones(graph.num_nodes, dtype=bool)
+        keep[[node for node in self.overlay if node < graph.num_nodes]] = False
+        sources = graph.edge_sources()
+        mask = keep[sources]
+        sources = [sources[mask].astype(np.int64)]
+        targets = [graph.indices[mask].astype(np.int64)]
+        for node, neighbors in self.overlay.items():
+            sources.append(np.full(len(neighbors), node, dtype=np.int64))
+            targets.append(np.fromiter(neighbors, dtype=np.int64, count=len(neighbors)))
+        alive = np.flatnonzero(self.alive[:num_nodes])
+        compact = np.full(num_nodes, -1, dtype=np.int64)
+        compact[alive] = np.arange(len(alive))
+        return CSRGraph.from_edges([self.node_ids[node] for node in alive.tolist()],
+                                   [self.node_labels[node] for node in alive.tolist()],
+                                   compact[np.concatenate(sources)], compact[np.concatenate(targets)])
+
+
+if __name__ == "__main__":
+    reference = IncrementalGraph(load_graph_from_json('graphs/graph.json'))
+    edited = IncrementalGraph(load_graph_from_json('graphs/graph.json'))
+    print("Unchanged copy matches" if reference.matches(edited) else "Unchanged copy differs")
+    source, target = edited.to_graph().edges()
+    node_ids = edited.node_ids
+    edited.remove_edge(node_ids[int(source[0])], node_ids[int(target[0])])
+    print(f"After removing one edge: {'matches' if reference.matches(edited) else 'differs'}, "
+          f"{edited.recomputed} node rounds recomputed")
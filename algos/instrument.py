@@ -0,0 +1,200 @@
+import threading
+
+from contextlib import contextmanager, nullcontext
+from timeit import default_timer as timer
+
+
+_state = threading.local()
+
+# Number of recordings active on any thread; while it is zero the functions
+# below return before touching the thread-local state. Recordings start and
+# stop on several threads (e.g. the GUI worker), so updates hold the lock.
+_active = 0
+_active_lock = threading.Lock()
+
+_NO_PHASE = nullcontext()
+
+
+def _new_profiler():
+    # cProfile and pstats are only imported when profiling is asked for
+    import cProfile
+    return cProfile.Profile()
+
+
+class Recorder:
+    # Phase timings and counters of the work done on one thread while it is
+    # installed with recording(). Phases nest; each finished phase is kept
+    # as an event with its path of enclosing phase names, its total time and
+    # its self time (total minus nested phases). Counters add up values,
+    # series keep every observed value in order (e.g. cells per round). With
+    # profile=True a cProfile profiler runs for the whole recording.
+    def __init__(self, profile=False):
+        self.counters = {}
+        self.series = {}
+        self.events = []
+        self.stack = []
+        self.profiler = _new_profiler() if profile else None
+        self.started = timer()
+        self.seconds = None
+
+    @contextmanager
+    def phase(self, name):
+        # Stack entries: [name, start time, time spent in nested phases]
+        entry = [name, timer(), 0.0]
+        self.stack.append(entry)
+        try:
+            yield
+        finally:
+            self.stack.pop()
+            seconds = timer() - entry[1]
+            if self.stack:
+                self.stack[-1][2] += seconds
+            path = tuple(frame[0] for frame in self.stack) + (name,)
+            self.events.append((path, entry[1] - self.started, seconds, seconds - entry[2]))
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        self.series.setdefault(name, []).append(value)
+
+    def phase_totals(self):
+        # 'outer/inner' -> {'calls', 'seconds', 'self_seconds'}
+        totals = {}
+        for path, _, seconds, self_seconds in self.events:
+            total = totals.setdefault('/'.join(path), {'calls': 0, 'seconds': 0.0, 'self_seconds': 0.0})
+            total['calls'] += 1
+            total['seconds'] += seconds
+            total['self_seconds'] += self_seconds
+        return totals
+
+    def to_dict(self):
+        return {
+            'seconds': self.seconds if self.seconds is not None else timer() - self.started,
+            'phases': self.phase_totals(),
+            'counters': dict(self.counters),
+            'series': {name: list(values) for name, values in self.series.items()},
+            'events': [{'path': list(path), 'start': start, 'seconds': seconds}
+                       for path, start, seconds, _ in self.events],
+        }
+
+    def to_json(self, indent=2):
+        import json
+        return json.dumps(self.to_dict(), indent=indent, default=float)
+
+    def write_json(self, file_path):
+        with open(file_path, 'w', encoding='utf-8') as file:
+            file.write(self.to_json())
+
+    def folded_stacks(self):
+        # One 'outer;inner microseconds' line per phase path with its self
+        # time, the input format of flamegraph.pl and speedscope
+        return [f"{name.replace('/', ';')} {round(total['self_seconds'] * 1e6)}"
+                for name, total in self.phase_totals().items()]
+
+    def write_folded(self, file_path):
+        with open(file_path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(self.folded_stacks()) + '\n')
+
+    def write_pstats(self, file_path):
+        # cProfile data for pstats, snakeviz or gprof2dot
+        if self.profiler is None:
+            raise ValueError('recording was started without profile=True')
+        self.profiler.dump_stats(file_path)
+
+    def profile_stats(self):
+        import pstats
+        return pstats.Stats(self.profiler) if self.profiler is not None else None
+
+    def summary(self):
+        # Short human-readable lines, e.g. for a log window
+        lines = [f"{name}: {total['seconds']:.6f} s" + (f" ({total['calls']}x)" if total['calls'] > 1 else "")
+                 for name, total in self.phase_totals().items()]
+        lines += [f"{name}: {value}" for name, value in self.counters.items()]
+        lines += [f"{name}: {', '.join(str(value) for value in values)}" for name, values in self.series.items()]
+        return lines
+
+
+@contextmanager
+def recording(recorder=None, profile=False):
+    # Installs a recorder for the current thread and yields it
+    global _active
+    recorder = Recorder(profile) if recorder is None else recorder
+    previous = getattr(_state, 'recorder', None)
+    _state.recorder = recorder
+    with _active_lock:
+        _active += 1
+    if recorder.profiler is not None:
+        recorder.profiler.enable()
+    try:
+        yield recorder
+    finally:
+        if recorder.profiler is not None:
+            recorder.profiler.disable()
+        recorder.seconds = timer() - recorder.started
+        _state.recorder = previous
+        with _active_lock:
+            _active -= 1
+
+
+# The functions below are what the algorithms call. Without a recorder on
+# the current thread each is a global check or a single attribute lookup;
+# hot loops keep local counts and report them once when they finish.
+
+def phase(name):
+    if not _active:
+        return _NO_PHASE
+    recorder = getattr(_state, 'recorder', None)
+    if recorder is None:
+        return _NO_PHASE
+    return recorder.phase(name)
+
+
+def count(name, value=1):
+    if not _active:
+        return
+    recorder = getattr(_state, 'recorder', None)
+    if recorder is not None:
+        recorder.count(name, value)
+
+
+def observe(name, value):
+    if not _active:
+        return
+    recorder = getattr(_state, 'recorder', None)
+    if recorder is not None:
+        recorder.observe(name, value)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from algos.binary_graph import load_graph
+    from algos.checkers import CHECKERS
+    # The algorithms record into the algos.instrument module, which is not
+    # this one when the file is run as a script
+    import algos.instrument as instrument
+
+    parser = argparse.ArgumentParser(description='Run one check with instrumentation and print or save the profile')
+    parser.add_argument('graph1', nargs='?', default='graphs/graph.json')
+    parser.add_argument('graph2', nargs='?', default='graphs/el_graph.json')
+    parser.add_argument('--checker', choices=sorted(CHECKERS), default='vf2')
+    parser.add_argument('--json', help='write phases, counters and events as JSON')
+    parser.add_argument('--folded', help='write folded stacks for flamegraph.pl or speedscope')
+    parser.add_argument('--pstats', help='also run cProfile and write its stats')
+    args = parser.parse_args()
+
+    with instrument.recording(profile=args.pstats is not None) as recorder:
+        graph1 = load_graph(args.graph1)
+        graph2 = load_graph(args.graph2)
+        with instrument.phase('check'):
+            result = CHECKERS[args.checker](graph1, graph2)
+    print(f"{args.checker}: {'isomorphic' if result else 'not isomorphic'} in {recorder.seconds:.6f} s")
+    for line in recorder.summary():
+        print('  ' + line)
+    if args.json:
+        recorder.write_json(args.json)
+    if args.folded:
+        recorder.write_folded(args.folded)
+    if args.pstats:
+        recorder.write_pstats(args.pstats)
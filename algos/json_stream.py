@@ -0,0 +1,276 @@
+import os
+import sys
+import json
+import tempfile
+import tracemalloc
+import numpy as np
+
+from timeit import default_timer as timer
+
+from algos.csr_graph import CSRGraph
+from algos.progress import report as report_progress
+
+
+CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = ' \t\n\r'
+
+
+class GrowableArray:
+    # Typed append-only buffer that doubles its capacity when full
+    def __init__(self, dtype, capacity=1024):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def append(self, value):
+        if self.size == len(self.data):
+            self.data = np.resize(self.data, 2 * len(self.data))
+        self.data[self.size] = value
+        self.size += 1
+
+    def array(self):
+        return self.data[:self.size]
+
+
+class _NodeIds:
+    # Integer ids stay in a typed array; the first non-integer id switches
+    # to a Python list.
+    def __init__(self):
+        self.numbers = GrowableArray(np.int64)
+        self.objects = None
+
+    def append(self, node_id):
+        if self.objects is None and isinstance(node_id, int) and not isinstance(node_id, bool):
+            self.numbers.append(node_id)
+            return
+        if self.objects is None:
+            self.objects = self.numbers.array().tolist()
+        self.objects.append(node_id)
+
+    def values(self):
+        return self.numbers.array() if self.objects is None else self.objects
+
+
+class _Reader:
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        self.characters_read = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        self.characters_read += len(chunk)
+        report_progress('characters read', self.characters_read)
+        return True
+
+    def peek(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in _WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                raise ValueError('Unexpected end of JSON graph file')
+
+    def expect(self, character):
+        if self.peek() != character:
+            raise ValueError(f'Expected {character!r} at offset {self.position} of the buffer')
+        self.position += 1
+
+    def value(self):
+        # A value that ends exactly at the end of the buffer may be a
+        # truncated number, so it is decoded again with more data.
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.position = end
+            return value
+
+    def _batch(self):
+        # Decodes every complete element left in the buffer with one C-level
+        # json.loads call. Cutting at a '}' inside a string leaves it
+        # unterminated, so a bad cut always fails and falls back to value().
+        end = self.buffer.rfind('}', self.position)
+        if end < 0:
+            return None
+        try:
+            items = json.loads('[' + self.buffer[self.position:end + 1] + ']')
+        except ValueError:
+            return None
+        self.position = end + 1
+        return items
+
+    def array(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+        failed_buffer = None
+        while True:
+            items = None
+            if failed_buffer is not self.buffer:
+                items = self._batch()
+                if items is None:
+                    failed_buffer = self.buffer
+            if items is None:
+                yield self.value()
+            else:
+                yield from items
+            if self.peek() == ',':
+                self.position += 1
+                continue
+            self.expect(']')
+            return
+
+
+def stream_graph_from_json(file_path, chunk_size=CHUNK_SIZE):
+    # Reads the top-level "nodes" and "edges" (or "links") arrays one element
+    # at a time straight into typed arrays, so the parsed document never
+    # exists in memory as a whole. Edge labels and the "directed" and
+    # "multigraph" flags are kept as in CSRGraph.from_json_data.
+    node_ids = _NodeIds()
+    labels = GrowableArray(np.int32)
+    label_index = {}
+    sources = _NodeIds()
+    targets = _NodeIds()
+    # (edge position, label) of the edges that have a label, usually none
+    labelled = []
+    num_edges = 0
+    flags = {'directed': False, 'multigraph': False}
+    with open(file_path, 'r') as file:
+        reader = _Reader(file, chunk_size)
+        reader.expect('{')
+        if reader.peek() == '}':
+            reader.position += 1
+        else:
+            while True:
+                key = reader.value()
+                reader.expect(':')
+                if key == 'nodes':
+                    for node in reader.array():
+                        node_ids.append(node['id'])
+                        labels.append(label_index.setdefault(node['label'], len(label_index)))
+                elif key in ('edges', 'links'):
+                    for edge in reader.array():
+                        sources.append(edge['source'])
+                        targets.append(edge['target'])
+                        if 'label' in edge:
+                            labelled.append((num_edges, edge['label']))
+                        num_edges += 1
+                elif key in flags:
+                    flags[key] = bool(reader.value())
+                else:
+                    reader.value()
+                if reader.peek() == ',':
+                    reader.position += 1
+                    continue
+                reader.expect('}')
+                break
+    edge_labels = edge_label_names = None
+    if labelled:
+        edge_label_index = {'': 0}
+        edge_labels = np.zeros(num_edges, dtype=np.int32)
+        positions, values = zip(*labelled)
+        edge_labels[list(positions)] = [edge_label_index.setdefault(value, len(edge_label_index)) for value in values]
+        edge_label_names = list(edge_label_index)
+    return _build_graph(node_ids.values(), labels.array(), label_index, sources.values(), targets.values(),
+                        (edge_labels, edge_label_names, flags['directed'], flags['multigraph']))
+
+
+def _build_graph(node_ids, labels, label_index, sources, targets, edge_data=(None, None, False, False)):
+    # edge_data holds the from_arrays arguments after targets
+    if isinstance(node_ids, np.ndarray) and isinstance(sources, np.ndarray) and isinstance(targets, np.ndarray):
+        # Vectorized id lookup; unknown edge endpoints become unlabelled nodes
+        endpoints = np.concatenate((sources, targets))
+        order = np.argsort(node_ids, kind='stable')
+        sorted_ids = node_ids[order]
+        slots = np.minimum(np.searchsorted(sorted_ids, endpoints), max(len(sorted_ids) - 1, 0))
+        known = sorted_ids[slots] == endpoints if len(sorted_ids) else np.zeros(len(endpoints), dtype=bool)
+        indices = np.empty(len(endpoints), dtype=np.int64)
+        indices[known] = order[slots[known]]
+        if not np.all(known):
+            extra_ids, extra_indices = np.unique(endpoints[~known], return_inverse=True)
+            indices[~known] = len(node_ids) + extra_indices.reshape(-1)
+            node_ids = np.concatenate((node_ids, extra_ids))
+            labels = np.concatenate((labels, np.full(len(extra_ids), label_index.setdefault('', len(label_index)),
+                                                     dtype=np.int32)))
+        return CSRGraph.from_arrays(node_ids, labels, list(label_index), indices[:len(sources)], indices[len(sources):],
+                                    *edge_data)
+
+    node_ids = list(node_ids)
+    labels = labels.tolist()
+    node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+    edge_indices = []
+    for endpoints in (sources, targets):
+        endpoints = endpoints.tolist() if isinstance(endpoints, np.ndarray) else endpoints
+        side = []
+        for endpoint in endpoints:
+            if endpoint not in node_index:
+                node_index[endpoint] = len(node_ids)
+                node_ids.append(endpoint)
+                labels.append(label_index.setdefault('', len(label_index)))
+            side.append(node_index[endpoint])
+        edge_indices.append(side)
+    return CSRGraph.from_arrays(node_ids, np.array(labels, dtype=np.int32), list(label_index), *edge_indices,
+                                *edge_data)
+
+
+def measure(load, file_path):
+    # Timed without tracemalloc, whose per-allocation hook skews the timing
+    start_time = timer()
+    load(file_path)
+    elapsed_time = timer() - start_time
+    tracemalloc.start()
+    load(file_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_time, peak
+
+
+def _load_whole_document(file_path):
+    with open(file_path, 'r') as file:
+        return CSRGraph.from_json_data(json.load(file))
+
+
+def report(file_paths):
+    print(f"{'file':<40} {'MB':>8} {'loader':<10} {'seconds':>9} {'MB/s':>8} {'peak MB':>9}")
+    for file_path in file_paths:
+        size = os.path.getsize(file_path) / 2 ** 20
+        for name, load in (('json.load', _load_whole_document), ('stream', stream_graph_from_json)):
+            elapsed_time, peak = measure(load, file_path)
+            print(f"{os.path.basename(file_path):<40} {size:>8.2f} {name:<10} {elapsed_time:>9.3f} "
+                  f"{size / elapsed_time:>8.1f} {peak / 2 ** 20:>9.1f}")
+
+
+if __name__ == "__main__":
+    from modules.generate_random_graph import erdos_renyi_graph, save_graph_to_json
+
+    file_paths = sys.argv[1:]
+    if file_paths:
+        report(file_paths)
+    else:
+        with tempfile.TemporaryDirectory(prefix='isograph-') as directory:
+            file_paths = sorted(os.path.join('graphs', name) for name in os.listdir('graphs') if name.endswith('.json'))
+            for num_nodes in (100000, 300000):
+                file_path = os.path.join(directory, f'rand_graph_{num_nodes}.json')
+                save_graph_to_json(erdos_renyi_graph(num_nodes, average_degree=8.0, num_labels=16, seed=0), file_path)
+                file_paths.append(file_path)
+            report(file_paths)
@@ -0,0 +1,276 @@
+import numpy as np
+
+from algos.bliss import canonical_mapping, target_cell
+from algos.instrument import count, phase
+from algos.progress import report
+from algos.csr_graph import CSRGraph, as_csr_graph, disjoint_union
+from algos.refinement import color_histograms_match, compress_colors, refine_round, refine_to_equitable, refine_until_stable, refinement_isomorphism
+
+
+# lift_mapping backtracks without automorphism pruning, which is
+# exponential on e.g. CFI pairs. After BACKTRACK_BUDGET exhausted subtrees,
+# or SEARCH_BUDGET search nodes per graph node (plus 64), it takes the
+# bijection from the two canonical labelings instead. Most isomorphic pairs
+# need a few search nodes and no backtracking; wrong candidates that fail
+# refinement right away, as in regular graphs, do not count as backtracks.
+BACKTRACK_BUDGET = 4
+SEARCH_BUDGET = 0.5
+
+# A mapping is either a dict from graph1 node ids to graph2 node ids, as
+# returned by the *_mapping functions, or an integer array where
+# mapping[i] is the graph2 node index matched to graph1 node index i.
+
+def mapping_array(graph1, graph2, mapping):
+    if not isinstance(mapping, dict):
+        return np.asarray(mapping, dtype=np.int64)
+    index2 = {node_id: i for i, node_id in enumerate(graph2.node_id_list())}
+    return np.array([index2.get(mapping.get(node_id), -1) for node_id in graph1.node_id_list()], dtype=np.int64)
+
+
+def mapping_dict(graph1, graph2, mapping):
+    if mapping is None:
+        return None
+    node_ids1 = graph1.node_id_list()
+    node_ids2 = graph2.node_id_list()
+    return {node_ids1[node1]: node_ids2[node2] for node1, node2 in enumerate(np.asarray(mapping).tolist())}
+
+
+def verify_mapping(graph1, graph2, mapping, use_labels=True):
+    # Checks that mapping is a bijection that carries labels and edges of
+    # graph1 exactly onto those of graph2: a few vectorized passes over the
+    # nodes and one sort of the relabelled edge list.
+    with phase('verify'):
+        return _verify_mapping(graph1, graph2, mapping, use_labels)
+
+
+def _verify_mapping(graph1, graph2, mapping, use_labels):
+    graph1 = as_csr_graph(graph1)
+    graph2 = as_csr_graph(graph2)
+    num_nodes = graph1.num_nodes
+    if num_nodes != graph2.num_nodes or len(graph1.indices) != len(graph2.indices):
+        return False
+    mapping = mapping_array(graph1, graph2, mapping)
+    if len(mapping) != num_nodes:
+        return False
+    if num_nodes == 0:
+        return True
+    if mapping.min() < 0 or mapping.max() >= num_nodes or np.any(np.bincount(mapping, minlength=num_nodes) != 1):
+        return False
+    if use_labels:
+        label_index2 = {name: i for i, name in enumerate(graph2.label_names)}
+        translation = np.array([label_index2.get(name, -1) for name in graph1.label_names], dtype=np.int64)
+        if np.any(translation[graph1.labels] != graph2.labels[mapping]):
+            return False
+    # Both CSR edge lists hold each edge in both directions; graph2's keys
+    # are already sorted by construction.
+    keys1 = mapping[graph1.edge_sources()] * num_nodes + mapping[graph1.indices]
+    keys2 = graph2.edge_sources().astype(np.int64) * num_nodes + graph2.indices
+    if graph1.edge_colors is None and graph2.edge_colors is None:
+        return bool(np.array_equal(np.sort(keys1), keys2))
+    order = np.argsort(keys1)
+    if not np.array_equal(keys1[order], keys2):
+        return False
+    # Slot by slot, the edge colors have to agree as well
+    colors1, names1 = graph1.edge_color_codes()
+    colors2, names2 = graph2.edge_color_codes()
+    name_index2 = {name: i for i, name in enumerate(names2)}
+    translation = np.array([name_index2.get(name, -1) for name in names1], dtype=np.int64)
+    return bool(np.array_equal(translation[colors1[order]], colors2))
+
+
+def _dense_colors(colors):
+    # Renumbers colors to 0..k-1 by table lookup. Unlike compress_colors the
+    # order is arbitrary, which is all the search needs, and no sort is done.
+    used = np.zeros(int(colors.max(initial=-1)) + 1, dtype=np.int64)
+    used[colors] = 1
+    return (np.cumsum(used) - 1)[colors]
+
+
+def _refine_matching(graph, colors, split):
+    # refine_to_equitable for a union of two graphs split at node split,
+    # giving up as soon as the two halves stop having equal histograms
+    num_colors = int(colors.max(initial=-1)) + 1
+    while color_histograms_match(colors, split):
+        colors = refine_round(graph, colors)
+        new_num_colors = int(colors.max(initial=-1)) + 1
+        if new_num_colors == num_colors:
+            break
+        num_colors = new_num_colors
+    return colors
+
+
+def _match_free(free, free_colors, split, first_color):
+    # Free nodes have no unresolved neighbors, so the nodes of a cell are
+    # interchangeable. Graph1 nodes come first within a cell; the k-th
+    # graph1 and the k-th graph2 node share a new color from first_color on.
+    order = np.lexsort((free, free_colors))
+    free, free_colors = free[order], free_colors[order]
+    starts = np.flatnonzero(np.r_[True, free_colors[1:] != free_colors[:-1]])
+    sizes = np.diff(np.r_[starts, len(free)])
+    rank = np.arange(len(free)) - (free >= split) * np.repeat(sizes // 2, sizes)
+    return free, first_color + rank
+
+
+def _refine_residual(union, colors):
+    # Refines only the unresolved part of the union: nodes whose color is
+    # shared by more than one matched pair, plus their resolved neighbors as
+    # a fixed boundary. Cells whose nodes have no unresolved neighbors hold
+    # interchangeable nodes and are matched in index order right away.
+    # Returns the changed nodes and their new colors, or None once the two
+    # halves no longer have equal histograms.
+    counts = np.bincount(colors)
+    residual = counts[colors] > 2
+    nodes = np.flatnonzero(residual)
+    split = len(colors) // 2
+    if len(nodes) == 0:
+        return nodes, colors[nodes]
+    if 2 * len(nodes) > len(colors):
+        # Mostly unresolved, a subgraph would not be much smaller
+        refined = _refine_matching(union, colors, split).astype(np.int64)
+        if not color_histograms_match(refined, split):
+            return None
+        sources = union.edge_sources()
+        inner_degrees = np.bincount(sources[residual[union.indices]], minlength=len(colors))
+        free = nodes[inner_degrees[nodes] == 0]
+        if len(free):
+            free, free_colors = _match_free(free, refined[free], split, int(refined.max()) + 1)
+            refined[free] = free_colors
+        return np.arange(len(colors)), refined
+    degrees = np.diff(union.indptr)[nodes]
+    row_starts = np.repeat(union.indptr[nodes] - np.cumsum(degrees) + degrees, degrees)
+    targets = union.indices[row_starts + np.arange(int(degrees.sum()))]
+    sources = np.repeat(nodes, degrees)
+    inner = residual[targets]
+    sub_nodes = np.union1d(nodes, targets)
+    local_sources = np.searchsorted(sub_nodes, sources)
+    local_targets = np.searchsorted(sub_nodes, targets)
+    # Residual rows hold inner edges in both directions, boundary edges once
+    all_sources = np.concatenate((local_sources, local_targets[~inner]))
+    all_targets = np.concatenate((local_targets, local_sources[~inner]))
+    order = np.lexsort((all_targets, all_sources))
+    indptr = np.zeros(len(sub_nodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(all_sources, minlength=len(sub_nodes)), out=indptr[1:])
+    edge_colors = None
+    if union.edge_colors is not None:
+        # Boundary rows see the residual rows' edges from the other end
+        slot_colors = union.edge_colors[row_starts + np.arange(int(degrees.sum()))]
+        edge_colors = np.concatenate((slot_colors, union.reverse_edge_colors()[slot_colors[~inner]]))[order]
+    sub = CSRGraph(sub_nodes, union.labels[sub_nodes], union.label_names, indptr, all_targets[order],
+                   edge_colors, union.edge_color_names, union.directed, union.multigraph)
+    sub_split = int(np.searchsorted(sub_nodes, split))
+    sub_colors = _refine_matching(sub, compress_colors(colors[sub_nodes]), sub_split)
+    if not color_histograms_match(sub_colors, sub_split):
+        return None
+    # New colors are appended after the old ones, and the numbering only
+    # gets compacted once it has grown well past the number of nodes
+    refined = sub_colors + int(colors.max()) + 1
+    free = nodes[np.bincount(np.repeat(np.arange(len(nodes)), degrees)[inner], minlength=len(nodes)) == 0]
+    if len(free):
+        free, free_colors = _match_free(free, refined[np.searchsorted(sub_nodes, free)], split,
+                                        int(refined.max()) + 1)
+        refined[np.searchsorted(sub_nodes, free)] = free_colors
+    if refined.max() >= 4 * len(colors):
+        full = colors.copy()
+        full[sub_nodes] = refined
+        return np.arange(len(colors)), _dense_colors(full)
+    return sub_nodes, refined
+
+
+def lift_mapping(graph1, graph2, use_labels=True):
+    # Turns equal stable colorings into an explicit bijection. Both graphs
+    # are refined together; while the coloring is not discrete, the first
+    # node of the first smallest cell of graph1 is individualized together
+    # with each same-colored graph2 node in turn and the unresolved part is
+    # refined again, backtracking when the color histograms split apart. A
+    # discrete coloring matches nodes by color and is only returned once
+    # verify_mapping accepts it, so None certifies that the graphs are not
+    # isomorphic. Past the search budget the canonical search, which prunes
+    # by automorphisms, decides instead.
+    graph1 = as_csr_graph(graph1)
+    graph2 = as_csr_graph(graph2)
+    if graph1.num_nodes != graph2.num_nodes or graph1.num_edges != graph2.num_edges:
+        return None
+    equivalent, _, colors1, colors2 = refine_until_stable(graph1, graph2, use_labels=use_labels)
+    if not equivalent:
+        return None
+    union = disjoint_union(graph1, graph2)
+    split = graph1.num_nodes
+    colors = refine_to_equitable(union, np.concatenate((colors1, colors2))).astype(np.int64)
+    changes = _refine_residual(union, colors) if color_histograms_match(colors, split) else None
+    if changes is None:
+        return None
+    colors[changes[0]] = changes[1]
+    with phase('search'):
+        return _search_bijection(graph1, graph2, union, colors, use_labels)
+
+
+def _search_bijection(graph1, graph2, union, colors, use_labels):
+    split = graph1.num_nodes
+    search_nodes = 0
+    pruned = 0
+    backtracks = 0
+    budget = int(SEARCH_BUDGET * split) + 64
+    # One coloring is updated in place. Stack frames: [individualized graph1
+    # node, graph2 candidates, next candidate index, undo list of (nodes,
+    # previous colors) for the changes that led to the frame]
+    stack = [[None, None, 0, []]]
+    while stack:
+        frame = stack[-1]
+        if frame[0] is None:
+            cell = target_cell(colors[:split])
+            if cell is None:
+                inverse2 = np.empty(int(colors.max(initial=-1)) + 1, dtype=np.int64)
+                inverse2[colors[split:]] = np.arange(split)
+                mapping = inverse2[colors[:split]]
+                if verify_mapping(graph1, graph2, mapping, use_labels):
+                    count('search nodes', search_nodes)
+                    count('pruned branches', pruned)
+                    return mapping
+                frame[1] = []
+            else:
+                frame[0] = int(cell[0])
+                frame[1] = np.flatnonzero(colors[split:] == colors[frame[0]]).tolist()
+        if frame[2] == len(frame[1]):
+            for nodes, previous in reversed(stack.pop()[3]):
+                colors[nodes] = previous
+            backtracks += 1
+            if stack and backtracks > BACKTRACK_BUDGET:
+                break
+            continue
+        pair = np.array([frame[0], split + frame[1][frame[2]]])
+        frame[2] += 1
+        search_nodes += 1
+        report('search nodes', search_nodes)
+        if search_nodes > budget:
+            break
+        undo = [(pair, colors[pair])]
+        colors[pair] = int(colors.max()) + 1
+        changes = _refine_residual(union, colors)
+        if changes is None:
+            colors[pair] = undo[0][1]
+            pruned += 1
+            continue
+        undo.append((changes[0], colors[changes[0]]))
+        colors[changes[0]] = changes[1]
+        stack.append([None, None, 0, undo])
+    count('search nodes', search_nodes)
+    count('pruned branches', pruned)
+    if not stack:
+        return None
+    count('canonical fallbacks')
+    mapping = canonical_mapping(graph1, graph2, use_labels)
+    return mapping if mapping is not None and verify_mapping(graph1, graph2, mapping, use_labels) else None
+
+
+def certified_mapping(graph1, graph2, use_labels=True):
+    graph1 = as_csr_graph(graph1)
+    graph2 = as_csr_graph(graph2)
+    return mapping_dict(graph1, graph2, lift_mapping(graph1, graph2, use_labels))
+
+
+def refinement_mapping(graph1, graph2, iterations=3):
+    # A positive answer is certified by lifting the coloring to a verified
+    # bijection; None when either the hash or the lifting rejects the pair.
+    if not refinement_isomorphism(graph1, graph2, iterations):
+        return None
+    return certified_mapping(graph1, graph2)
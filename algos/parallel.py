@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+from algos.cache import GraphCache
+from algos.checkers import CHECKERS
+from algos.batch import isomorphism_classes
+from algos.csr_graph import CSRGraph
+from algos.binary_graph import load_binary_graph, load_graph, save_binary_graph
+
+
+class SharedGraph:
+    # Picklable handle to a CSRGraph written as one binary graph file on a
+    # tmpfs (/dev/shm where available). Workers memory-map it, so every
+    # process reads the same pages and only the file name is pickled.
+    def __init__(self, graph):
+        base = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        self.directory = tempfile.mkdtemp(prefix='isograph-', dir=base)
+        self.file_path = os.path.join(self.directory, 'graph.isog')
+        save_binary_graph(graph, self.file_path)
+
+    def attach(self):
+        return _attach(self.file_path)
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@lru_cache(maxsize=16)
+def _attach(file_path):
+    return load_binary_graph(file_path)
+
+
+@lru_cache(maxsize=16)
+def _load(file_path):
+    return load_graph(file_path)
+
+
+def _resolve(item):
+    if isinstance(item, SharedGraph):
+        return item.attach()
+    return _load(item)
+
+
+_worker_cache = None
+
+
+def _init_worker(cache_path):
+    global _worker_cache
+    if cache_path is not None:
+        _worker_cache = GraphCache(cache_path)
+
+
+def _with_worker_cache(function, item):
+    return function(item, cache=_worker_cache)
+
+
+def _check_pair(task):
+    algorithm, item1, item2 = task
+    return CHECKERS[algorithm](_resolve(item1), _resolve(item2))
+
+
+def make_executor(max_workers=None, cache_path=None):
+    return ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(cache_path,))
+
+
+def _chunksize(num_items, max_workers):
+    return max(1, num_items // (4 * (max_workers or os.cpu_count() or 1)))
+
+
+def check_pairs(pairs, algorithm='vf2', max_workers=None):
+    # pairs holds (graph1, graph2) items that are file paths (parsed in the
+    # workers) or CSRGraphs (shared once each). Results keep input order.
+    pairs = list(pairs)
+    shared = {}
+    tasks = []
+    try:
+        for pair in pairs:
+            items = []
+            for item in pair:
+                if isinstance(item, CSRGraph):
+                    if id(item) not in shared:
+                        shared[id(item)] = SharedGraph(item)
+                    item = shared[id(item)]
+                items.append(item)
+            tasks.append((algorithm, items[0], items[1]))
+        with make_executor(max_workers) as executor:
+            return list(executor.map(_check_pair, tasks, chunksize=_chunksize(len(tasks), max_workers)))
+    finally:
+        for shared_graph in shared.values():
+            shared_graph.close()
+
+
+def parallel_isomorphism_classes(source, max_workers=None, cache_path=None, use_labels=True):
+    with make_executor(max_workers, cache_path) as executor:
+        def map_function(function, items):
+            return list(executor.map(_with_worker_cache, [function] * len(items), items,
+                                     chunksize=_chunksize(len(items), max_workers)))
+        return isomorphism_classes(source, use_labels=use_labels, map_function=map_function)
+
+
+if __name__ == "__main__":
+    for i, group in enumerate(parallel_isomorphism_classes('graphs', use_labels=False)):
+        print(f"Class {i + 1}: {', '.join(group)}")
@@ -0,0 +1,173 @@
+import hashlib
+import numpy as np
+
+from collections import OrderedDict
+
+from algos.refinement import refine_round
+
+
+MAX_PREVIEW_NODES = 150
+MAX_PREVIEW_EDGES = 600
+LAYOUT_CACHE_SIZE = 16
+
+_layout_cache = OrderedDict()
+
+
+class GraphPreview:
+    # A small drawable stand-in for a graph: positions of the preview nodes,
+    # edges between them as index pairs, and per-node and per-edge weights.
+    # kind is 'full', 'quotient' (one node per color class, weighted by class
+    # size) or 'sample' (the neighborhood of the highest-degree node).
+    def __init__(self, kind, positions, sources, targets, node_weights, edge_weights, labels, num_nodes, num_edges):
+        self.kind = kind
+        self.positions = positions
+        self.sources = sources
+        self.targets = targets
+        self.node_weights = node_weights
+        self.edge_weights = edge_weights
+        self.labels = labels
+        self.num_nodes = num_nodes
+        self.num_edges = num_edges
+
+    def segments(self):
+        # (edges, 2, 2) array as expected by matplotlib's LineCollection
+        return np.stack((self.positions[self.sources], self.positions[self.targets]), axis=1)
+
+
+def spring_layout(num_nodes, sources, targets, edge_weights=None, iterations=100, seed=0):
+    # Fruchterman-Reingold with dense NumPy forces, meant for the few
+    # hundred nodes of a preview. Positions are scaled into [-1, 1].
+    rng = np.random.default_rng(seed)
+    positions = rng.random((num_nodes, 2))
+    if num_nodes <= 1:
+        return positions * 0
+    edge_weights = np.ones(len(sources)) if edge_weights is None else edge_weights
+    k = np.sqrt(1.0 / num_nodes)
+    temperature = 0.1
+    for iteration in range(iterations):
+        delta = positions[:, None, :] - positions[None, :, :]
+        distance = np.maximum(np.linalg.norm(delta, axis=2), 0.01)
+        displacement = np.einsum('ij,ijk->ik', k * k / distance ** 2, delta)
+        edge_delta = positions[sources] - positions[targets]
+        edge_distance = np.maximum(np.linalg.norm(edge_delta, axis=1), 0.01)
+        pull = edge_delta * (edge_weights * edge_distance / k)[:, None]
+        np.subtract.at(displacement, sources, pull)
+        np.add.at(displacement, targets, pull)
+        length = np.maximum(np.linalg.norm(displacement, axis=1), 0.01)
+        positions += displacement * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= 0.1 / (iterations + 1)
+    positions -= positions.mean(axis=0)
+    return positions / max(np.abs(positions).max(), 1e-9)
+
+
+def _full_preview(graph):
+    sources, targets = graph.edges()
+    mask = sources != targets
+    sources, targets = sources[mask], targets[mask]
+    positions = spring_layout(graph.num_nodes, sources, targets)
+    return GraphPreview('full', positions, sources, targets, np.ones(graph.num_nodes), np.ones(len(sources)),
+                        graph.node_labels(), graph.num_nodes, graph.num_edges)
+
+
+def quotient_colors(graph, max_classes=MAX_PREVIEW_NODES):
+    # Finest structural refinement round (labels ignored, so unique labels do
+    # not make every node its own class) with at most max_classes classes;
+    # None when even degrees give too many classes or all nodes look alike.
+    colors = np.zeros(graph.num_nodes, dtype=np.int32)
+    best = None
+    num_colors = 1
+    while True:
+        colors = refine_round(graph, colors)
+        new_num_colors = int(colors.max(initial=-1)) + 1
+        if new_num_colors > max_classes:
+            break
+        best = colors
+        if new_num_colors == num_colors:
+            break
+        num_colors = new_num_colors
+    if best is None or int(best.max(initial=-1)) + 1 < 2:
+        return None
+    return best
+
+
+def _quotient_preview(graph, colors, max_edges):
+    num_classes = int(colors.max()) + 1
+    sources, targets = graph.edges()
+    class_sources, class_targets = colors[sources].astype(np.int64), colors[targets].astype(np.int64)
+    mask = class_sources != class_targets
+    keys = (np.minimum(class_sources, class_targets) * num_classes + np.maximum(class_sources, class_targets))[mask]
+    keys, counts = np.unique(keys, return_counts=True)
+    if len(keys) > max_edges:
+        # Keep the heaviest connections between classes
+        keep = np.sort(np.argsort(counts, kind='stable')[-max_edges:])
+        keys, counts = keys[keep], counts[keep]
+    quotient_sources, quotient_targets = keys // num_classes, keys % num_classes
+    edge_weights = np.log1p(counts)
+    positions = spring_layout(num_classes, quotient_sources, quotient_targets, edge_weights / edge_weights.max()
+                              if len(counts) else edge_weights)
+    sizes = np.bincount(colors, minlength=num_classes)
+    return GraphPreview('quotient', positions, quotient_sources, quotient_targets, sizes, edge_weights,
+                        [str(size) for size in sizes.tolist()], graph.num_nodes, graph.num_edges)
+
+
+def _sample_preview(graph, max_nodes, max_edges):
+    # Breadth-first ball around the highest-degree node
+    degrees = graph.degrees()
+    start = int(np.argmax(degrees)) if graph.num_nodes else 0
+    order = [start]
+    index = {start: 0}
+    head = 0
+    while head < len(order) and len(order) < max_nodes:
+        for neighbor in graph.neighbors(order[head]).tolist():
+            if neighbor not in index and len(order) < max_nodes:
+                index[neighbor] = len(order)
+                order.append(neighbor)
+        head += 1
+    selected = np.array(order, dtype=np.int64)
+    local = np.full(graph.num_nodes, -1, dtype=np.int64)
+    local[selected] = np.arange(len(selected))
+    sources = np.repeat(np.arange(len(selected)), degrees[selected])
+    targets = local[np.concatenate([graph.neighbors(node) for node in order])] if order else np.array([], np.int64)
+    mask = (targets > sources)
+    sources, targets = sources[mask][:max_edges], targets[mask][:max_edges]
+    positions = spring_layout(len(selected), sources, targets)
+    labels = graph.node_labels()
+    return GraphPreview('sample', positions, sources, targets, np.ones(len(selected)), np.ones(len(sources)),
+                        [labels[node] for node in order], graph.num_nodes, graph.num_edges)
+
+
+def _graph_digest(graph):
+    # Label and edge color names count too: two graphs with the same arrays
+    # but different names draw differently
+    digest = hashlib.blake2b(digest_size=16)
+    arrays = [graph.indptr, graph.indices, graph.labels]
+    if graph.edge_colors is not None:
+        arrays.append(graph.edge_colors)
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).data)
+    digest.update(repr((list(graph.label_names), graph.edge_color_names, graph.directed,
+                        graph.multigraph)).encode('utf-8'))
+    return digest.digest()
+
+
+def graph_preview(graph, mode='auto', max_nodes=MAX_PREVIEW_NODES, max_edges=MAX_PREVIEW_EDGES):
+    # Graphs within the limits are drawn whole. Larger ones become the
+    # quotient by structural color classes in 'auto' mode when refinement
+    # yields a useful number of classes, and a sampled neighborhood
+    # otherwise. Results are cached per graph content.
+    key = (_graph_digest(graph), mode, max_nodes, max_edges)
+    if key in _layout_cache:
+        _layout_cache.move_to_end(key)
+        return _layout_cache[key]
+    if mode == 'full' or (mode == 'auto' and graph.num_nodes <= max_nodes and graph.num_edges <= max_edges):
+        preview = _full_preview(graph)
+    else:
+        colors = quotient_colors(graph, max_nodes) if mode in ('auto', 'quotient') else None
+        if colors is not None:
+            preview = _quotient_preview(graph, colors, max_edges)
+        else:
+            preview = _sample_preview(graph, max_nodes, max_edges)
+    _layout_cache[key] = preview
+    if len(_layout_cache) > LAYOUT_CACHE_SIZE:
+        _layout_cache.popitem(last=False)
+    return preview
@@ -0,0 +1,50 @@
+import threading
+
+from contextlib import contextmanager
+
+
+class Cancelled(Exception):
+    pass
+
+
+_state = threading.local()
+
+
+def report(stage, value):
+    # Called from the algorithms' main loops. A callback installed for the
+    # current thread receives (stage, value) and may raise Cancelled to stop
+    # the running check; without one this is a single attribute lookup.
+    callback = getattr(_state, 'callback', None)
+    if callback is not None:
+        callback(stage, value)
+
+
+@contextmanager
+def progress_callback(callback):
+    previous = getattr(_state, 'callback', None)
+    _state.callback = callback
+    try:
+        yield
+    finally:
+        _state.callback = previous
+
+
+class CancelToken:
+    # Progress callback for a background worker: keeps the latest value per
+    # stage for the UI thread to poll and raises Cancelled once cancel() was
+    # called from any thread.
+    def __init__(self):
+        self.event = threading.Event()
+        self.latest = {}
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def __call__(self, stage, value):
+        self.latest[stage] = value
+        if self.event.is_set():
+            raise Cancelled(stage)
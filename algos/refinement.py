@@ -0,0 +1,221 @@
+import hashlib
+import numpy as np
+
+from algos.csr_graph import PLAIN_EDGE, as_csr_graph, disjoint_union
+from algos.instrument import count, observe, phase
+from algos.progress import report
+
+
+_MIX1 = np.uint64(0xbf58476d1ce4e5b9)
+_MIX2 = np.uint64(0x94d049bb133111eb)
+_NEIGHBOR_SALT = np.uint64(0x9e3779b97f4a7c15)
+_MULTISET_SALT = np.uint64(0x2545f4914f6cdd1d)
+
+
+def mix_hashes(values):
+    # splitmix64 finalizer, wraps modulo 2**64
+    values = values.astype(np.uint64)
+    values = (values ^ (values >> np.uint64(30))) * _MIX1
+    values = (values ^ (values >> np.uint64(27))) * _MIX2
+    return values ^ (values >> np.uint64(31))
+
+
+def compress_colors(values):
+    _, colors = np.unique(values, return_inverse=True)
+    return colors.astype(np.int32).reshape(-1)
+
+
+def signature_hashes(graph, colors):
+    # Order-independent hash of (color, multiset of (neighbor color, edge
+    # color)) per node.
+    return neighborhood_hashes(colors, colors[graph.indices], graph.indptr, edge_hashes(graph))
+
+
+def edge_hashes(graph):
+    # Content hash of every CSR slot's edge color, 0 for PLAIN_EDGE so that
+    # plain edges hash as in a graph without edge colors; None for a plain
+    # graph.
+    if graph.edge_colors is None:
+        return None
+    names = graph.edge_color_names
+    hashes = label_name_hashes(names)
+    hashes[[i for i, name in enumerate(names) if name == PLAIN_EDGE]] = 0
+    return hashes[graph.edge_colors]
+
+
+def neighborhood_hashes(colors, neighbor_colors, indptr, edge_hashes=None):
+    # signature_hashes for a set of nodes with the given colors whose
+    # neighbors' colors (and optionally the edges' hashes) are listed row by
+    # row in CSR layout.
+    neighbor_hashes = neighbor_colors.astype(np.uint64) + _NEIGHBOR_SALT
+    if edge_hashes is not None:
+        neighbor_hashes ^= edge_hashes
+    neighbor_hashes = mix_hashes(neighbor_hashes)
+    prefix = np.zeros(len(neighbor_hashes) + 1, dtype=np.uint64)
+    np.cumsum(neighbor_hashes, out=prefix[1:])
+    neighbor_sums = prefix[indptr[1:]] - prefix[indptr[:-1]]
+    return mix_hashes(mix_hashes(colors) ^ neighbor_sums)
+
+
+def multiset_hash(values):
+    # Additive hash of a multiset of node hashes modulo 2**64: adding or
+    # removing members updates it without looking at the others.
+    return int(np.sum(mix_hashes(np.asarray(values, dtype=np.uint64) ^ _MULTISET_SALT), dtype=np.uint64))
+
+
+def sorted_neighbor_colors(graph, colors):
+    # Per row, the sorted neighbor colors combined with the edge colors
+    sources = graph.edge_sources().astype(np.int64)
+    values = colors[graph.indices].astype(np.int64)
+    if graph.edge_colors is not None:
+        values = values * len(graph.edge_color_names) + graph.edge_colors
+    stride = int(values.max(initial=0)) + 1
+    keys = np.sort(sources * stride + values)
+    return keys - sources * stride
+
+
+def _signatures_collide(graph, colors, new_colors):
+    # Every node must have exactly the signature of the first node that got
+    # the same hash, otherwise two different signatures share a hash value.
+    num_nodes = graph.num_nodes
+    representative = np.full(new_colors.max(initial=-1) + 1, num_nodes, dtype=np.int64)
+    np.minimum.at(representative, new_colors, np.arange(num_nodes))
+    representative = representative[new_colors]
+    if np.any(colors != colors[representative]):
+        return True
+    degrees = graph.degrees()
+    if np.any(degrees != degrees[representative]):
+        return True
+    neighbor_colors = sorted_neighbor_colors(graph, colors)
+    sources = graph.edge_sources()
+    offsets = np.arange(len(graph.indices)) - graph.indptr[sources]
+    twin_slots = graph.indptr[representative[sources]] + offsets
+    return bool(np.any(neighbor_colors != neighbor_colors[twin_slots]))
+
+
+def _exact_refine_round(graph, colors):
+    # Colors are ranked by sorted signature so that, like the hash order, they
+    # do not depend on the node numbering.
+    neighbor_colors = sorted_neighbor_colors(graph, colors).tolist()
+    indptr = graph.indptr.tolist()
+    signatures = [(color, tuple(neighbor_colors[indptr[node]:indptr[node + 1]]))
+                  for node, color in enumerate(colors.tolist())]
+    signature_index = {signature: i for i, signature in enumerate(sorted(set(signatures)))}
+    return np.array([signature_index[signature] for signature in signatures], dtype=np.int32)
+
+
+def refine_round(graph, colors):
+    new_colors = compress_colors(signature_hashes(graph, colors))
+    if _signatures_collide(graph, colors, new_colors):
+        return _exact_refine_round(graph, colors)
+    return new_colors
+
+
+def initial_colors(graph):
+    return compress_colors(graph.labels)
+
+
+def refine_to_equitable(graph, colors):
+    # Called once per search node, so rounds are only counted
+    num_colors = int(colors.max(initial=-1)) + 1
+    rounds = 0
+    while True:
+        colors = refine_round(graph, colors)
+        rounds += 1
+        new_num_colors = int(colors.max(initial=-1)) + 1
+        if new_num_colors == num_colors:
+            count('equitable refinement rounds', rounds)
+            return colors
+        num_colors = new_num_colors
+
+
+def refinement_hashes(graph, iterations, colors=None):
+    # Colors stay full-width hashes seeded from the label contents instead of
+    # being compressed per graph, so the hashes of two graphs can be compared.
+    graph = as_csr_graph(graph)
+    if colors is None:
+        colors = label_hashes(graph)
+    for round_number in range(iterations):
+        with phase('refinement round'):
+            colors = signature_hashes(graph, colors)
+        observe('partition cells', len(np.unique(colors)))
+        report('refinement round', round_number + 1)
+    return colors
+
+
+def color_histograms_match(colors, split):
+    num_colors = int(colors.max(initial=-1)) + 1
+    histogram1 = np.bincount(colors[:split], minlength=num_colors)
+    histogram2 = np.bincount(colors[split:], minlength=num_colors)
+    return np.array_equal(histogram1, histogram2)
+
+
+def refine_until_stable(graph1, graph2, max_rounds=None, use_labels=True, node_invariants=None):
+    # Refines both graphs as one disjoint union so colors are comparable, and
+    # stops as soon as their color histograms differ or the partition stops
+    # splitting. node_invariants=(values1, values2) optionally splits the
+    # initial colors further. Returns (histograms match, rounds done,
+    # colors1, colors2).
+    graph1 = as_csr_graph(graph1)
+    graph2 = as_csr_graph(graph2)
+    union = disjoint_union(graph1, graph2)
+    split = graph1.num_nodes
+    if use_labels:
+        colors = initial_colors(union)
+    else:
+        colors = np.zeros(union.num_nodes, dtype=np.int32)
+    if node_invariants is not None:
+        invariants = np.concatenate(node_invariants).astype(np.int64)
+        colors = compress_colors(colors * (int(invariants.max(initial=0)) + 1) + invariants)
+    num_colors = int(colors.max(initial=-1)) + 1
+    rounds = 0
+    equivalent = color_histograms_match(colors, split)
+    while equivalent and (max_rounds is None or rounds < max_rounds):
+        with phase('refinement round'):
+            colors = refine_round(union, colors)
+        observe('partition cells', int(colors.max(initial=-1)) + 1)
+        rounds += 1
+        report('refinement round', rounds)
+        equivalent = color_histograms_match(colors, split)
+        new_num_colors = int(colors.max(initial=-1)) + 1
+        if new_num_colors == num_colors:
+            break
+        num_colors = new_num_colors
+    return equivalent, rounds, colors[:split], colors[split:]
+
+
+def label_name_hashes(names):
+    return np.array([
+        int.from_bytes(hashlib.blake2b(str(name).encode(), digest_size=8).digest(), 'little')
+        for name in names
+    ], dtype=np.uint64)
+
+
+def label_hashes(graph):
+    # Content hash of each label name, so colors are comparable across graphs
+    # without a shared label table.
+    return label_name_hashes(graph.label_names)[graph.labels]
+
+
+def hash_histogram(hashes):
+    # Sorted (hash, class size) pairs of refinement_hashes; equal for
+    # isomorphic graphs
+    values, counts = np.unique(hashes, return_counts=True)
+    return tuple(zip(values.tolist(), counts.tolist()))
+
+
+# The color refinement, Weisfeiler-Lehman and simplified Babai checkers are
+# all this one test under different names; their modules alias these.
+def refinement_hash(graph, iterations=3):
+    return hash_histogram(refinement_hashes(graph, iterations))
+
+
+def stable_refinement_isomorphism(graph1, graph2, max_rounds=None):
+    is_isomorphic, rounds, _, _ = refine_until_stable(graph1, graph2, max_rounds)
+    return is_isomorphic, rounds
+
+
+def refinement_isomorphism(graph1, graph2, iterations=3):
+    if iterations is None:
+        return stable_refinement_isomorphism(graph1, graph2)[0]
+    return refinement_hash(graph1, iterations) == refinement_hash(graph2, iterations)
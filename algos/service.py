@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import inspect
+import threading
+import traceback
+
+from functools import lru_cache
+from timeit import default_timer as timer
+from concurrent.futures import ProcessPoolExecutor
+
+from algos.bliss import canonical_labeling
+from algos.cache import DEFAULT_CACHE_PATH, GraphCache
+from algos.checkers import CHECKERS, MAPPINGS
+from algos.binary_graph import load_graph
+from algos.instrument import recording
+
+
+# Besides the CHECKERS, jobs may ask for 'certificate': cached fingerprints
+# and canonical certificates only, the cheapest check for graphs seen before
+ALGORITHMS = sorted(CHECKERS) + ['certificate']
+
+_worker_cache = None
+
+
+def _init_worker(cache_path):
+    global _worker_cache
+    if cache_path is not None:
+        _worker_cache = GraphCache(cache_path)
+
+
+@lru_cache(maxsize=16)
+def _load(file_path, mtime_ns, size):
+    return load_graph(file_path)
+
+
+def _graph(file_path):
+    # Keyed on the file's mtime and size as well, so a long-running service
+    # picks up graph files rewritten between jobs
+    stat = os.stat(file_path)
+    return _load(os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+
+def _accepts_labels(function):
+    return 'use_labels' in inspect.signature(function).parameters
+
+
+def _check(job):
+    algorithm = job.get('algorithm', 'vf2')
+    use_labels = job.get('use_labels', True)
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f'unknown algorithm {algorithm!r}')
+    graph1, graph2 = _graph(job['graph1']), _graph(job['graph2'])
+    result = {}
+    if _worker_cache is not None:
+        # Cached fingerprints reject most non-isomorphic pairs before any
+        # checker runs
+        fingerprint1 = _worker_cache.fingerprint(job['graph1'], graph1, use_labels)
+        rejected_by = fingerprint1.first_difference(_worker_cache.fingerprint(job['graph2'], graph2, use_labels))
+        if rejected_by is not None:
+            return {'isomorphic': False, 'rejected_by': rejected_by}
+    if algorithm == 'certificate':
+        if _worker_cache is None:
+            certificate1 = canonical_labeling(graph1, use_labels)[1]
+            certificate2 = canonical_labeling(graph2, use_labels)[1]
+        else:
+            certificate1 = _worker_cache.certificate(job['graph1'], graph1, use_labels)
+            certificate2 = _worker_cache.certificate(job['graph2'], graph2, use_labels)
+        result['isomorphic'] = certificate1 == certificate2
+        return result
+    functions = MAPPINGS if job.get('mapping') else CHECKERS
+    function = functions[algorithm]
+    kwargs = {'use_labels': use_labels} if _accepts_labels(function) else {}
+    answer = function(graph1, graph2, **kwargs)
+    if job.get('mapping'):
+        result['isomorphic'] = answer is not None
+        if answer is not None:
+            # Pairs rather than an object, since JSON keys must be strings
+            result['mapping'] = [[node1, node2] for node1, node2 in answer.items()]
+    else:
+        result['isomorphic'] = bool(answer)
+    return result
+
+
+def run_job(job):
+    # Runs one job in a worker and always returns a result dict; errors are
+    # reported in it instead of being raised across the process boundary
+    result = {'id': job.get('id'), 'algorithm': job.get('algorithm', 'vf2')}
+    start_time = timer()
+    try:
+        if job.get('profile'):
+            with recording() as recorder:
+                result.update(_check(job))
+            profile = recorder.to_dict()
+            result['profile'] = {'phases': profile['phases'], 'counters': profile['counters']}
+        else:
+            result.update(_check(job))
+    except Exception as error:
+        result['error'] = f'{type(error).__name__}: {error}'
+        if job.get('traceback'):
+            result['traceback'] = traceback.format_exc()
+    result['seconds'] = timer() - start_time
+    return result
+
+
+def read_jobs(lines, defaults=None):
+    # Yields (job, None) for every non-empty line of JSONL input, or
+    # (None, error result) for a line that is not a valid job. Jobs without
+    # an 'id' get their line number.
+    defaults = defaults or {}
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+            if not isinstance(job, dict) or 'graph1' not in job or 'graph2' not in job:
+                raise ValueError('a job needs "graph1" and "graph2"')
+        except ValueError as error:
+            yield None, {'id': line_number, 'error': f'line {line_number}: {error}'}
+            continue
+        job = {**defaults, **job}
+        job.setdefault('id', line_number)
+        yield job, None
+
+
+class ResultWriter:
+    # Writes one JSON line per result as soon as it is ready; called from
+    # the executor's callback thread, hence the lock
+    def __init__(self, file):
+        self.file = file
+        self.lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+
+    def write(self, result):
+        line = json.dumps(result, default=str)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+            self.written += 1
+            self.failed += 'error' in result
+
+
+def serve(lines, output, max_workers=None, max_pending=None, cache_path=DEFAULT_CACHE_PATH, defaults=None):
+    # Reads jobs from an iterable of JSONL lines (a file or sys.stdin, which
+    # may keep producing lines for as long as the service runs) and runs them
+    # on one process pool whose workers share the on-disk fingerprint and
+    # certificate cache and keep recently used graphs loaded. At most
+    # max_pending jobs are queued or running at a time, so reading waits for
+    # the pool instead of buffering the whole input. Results are written to
+    # output in completion order; match them to jobs by 'id'.
+    max_workers = max_workers or os.cpu_count() or 1
+    pending = threading.BoundedSemaphore(max_pending or 2 * max_workers)
+    writer = ResultWriter(output)
+
+    def finish(future, job):
+        try:
+            result = future.result()
+        except Exception as error:
+            # The worker process died; the pool is unusable from here on
+            result = {'id': job['id'], 'algorithm': job.get('algorithm', 'vf2'),
+                      'error': f'{type(error).__name__}: {error}'}
+        writer.write(result)
+        pending.release()
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(cache_path,)) as executor:
+        for job, error in read_jobs(lines, defaults):
+            if error is not None:
+                writer.write(error)
+                continue
+            pending.acquire()
+            future = executor.submit(run_job, job)
+            future.add_done_callback(lambda future, job=job: finish(future, job))
+    return writer
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Check graph pairs read as JSONL jobs, e.g. {"id": 1, "graph1": "a.json", "graph2": "b.json", '
+                    '"algorithm": "vf2", "use_labels": true, "mapping": false, "profile": false}, '
+                    'and stream one JSON result line per job')
+    parser.add_argument('jobs', nargs='?', default='-', help='JSONL file of jobs, or - for stdin (default)')
+    parser.add_argument('-o', '--output', help='JSONL file for the results (default: stdout)')
+    parser.add_argument('-j', '--workers', type=int, help='worker processes (default: CPU count)')
+    parser.add_argument('--max-pending', type=int, help='jobs queued or running at once (default: 2 per worker)')
+    parser.add_argument('--algorithm', choices=ALGORITHMS, default='vf2', help='for jobs that name none')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help='SQLite cache shared by the workers')
+    parser.add_argument('--no-cache', action='store_true', help='run without the fingerprint cache')
+    args = parser.parse_args()
+
+    jobs = sys.stdin if args.jobs == '-' else open(args.jobs, encoding='utf-8')
+    output = sys.stdout if args.output is None else open(args.output, 'w', encoding='utf-8')
+    try:
+        writer = serve(jobs, output, args.workers, args.max_pending, None if args.no_cache else args.cache,
+                       {'algorithm': args.algorithm})
+    finally:
+        if jobs is not sys.stdin:
+            jobs.close()
+        if output is not sys.stdout:
+            output.close()
+    print(f"{writer.written} results, {writer.failed} errors", file=sys.stderr)
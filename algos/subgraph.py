@@ -0,0 +1,227 @@
+import re
+import numpy as np
+
+from algos.csr_graph import as_csr_graph, load_graph_from_json
+from algos.instrument import count, phase
+from algos.progress import report
+
+
+# Neighbor labels are counted per bucket (label code modulo this), capped at
+# 255 so that a signature row fits in SIGNATURE_BUCKETS bytes
+SIGNATURE_BUCKETS = 16
+
+
+def label_kind(name):
+    # Device kind of a schematic label: 'M1_26' -> 'M1', 'N0' -> 'N'. Useful
+    # as label_key, since a cell and the netlist it occurs in number their
+    # nodes differently.
+    return re.sub(r'_?\d+$', '', str(name))
+
+
+class TargetIndex:
+    # Per-target index for subgraph search: an interned label code, the
+    # degree and a neighborhood signature of every node, plus the nodes of
+    # each label sorted by degree. A pattern node can only be matched to a
+    # target node with the same label, at least its degree and at least as
+    # many neighbors in every signature bucket. Build it once and pass it to
+    # subgraph_matches for every pattern searched in the same target.
+    def __init__(self, target, use_labels=True, label_key=None):
+        with phase('index'):
+            self._build(as_csr_graph(target), use_labels, label_key)
+
+    def _build(self, target, use_labels, label_key):
+        self.target = target
+        self.use_labels = use_labels
+        self.label_key = label_key
+        self.key_codes = {}
+        self.codes = self.label_codes(target)
+        self.degrees = target.degrees()
+        self.signatures = self.neighbor_signatures(target, self.codes)
+        order = np.lexsort((self.degrees, self.codes))
+        starts = np.searchsorted(self.codes[order], np.arange(len(self.key_codes) + 1))
+        self.by_label = [order[starts[code]:starts[code + 1]] for code in range(len(self.key_codes))]
+        self.neighbor_sets = {}
+
+    def label_codes(self, graph, intern=True):
+        # Codes of graph's labels in this index; with intern=False keys the
+        # target does not have get -1. Without labels every node has code 0.
+        if not self.use_labels:
+            self.key_codes.setdefault(None, 0)
+            return np.zeros(graph.num_nodes, dtype=np.int32)
+        codes = []
+        for name in graph.label_names:
+            key = name if self.label_key is None else self.label_key(name)
+            codes.append(self.key_codes.setdefault(key, len(self.key_codes)) if intern else self.key_codes.get(key, -1))
+        return np.array(codes, dtype=np.int32)[graph.labels] if codes else np.zeros(graph.num_nodes, dtype=np.int32)
+
+    @staticmethod
+    def neighbor_signatures(graph, codes):
+        buckets = (np.maximum(codes, 0) % SIGNATURE_BUCKETS).astype(np.int64)
+        counts = np.bincount(graph.edge_sources().astype(np.int64) * SIGNATURE_BUCKETS + buckets[graph.indices],
+                             minlength=graph.num_nodes * SIGNATURE_BUCKETS)
+        return np.minimum(counts, 255).astype(np.uint8).reshape(graph.num_nodes, SIGNATURE_BUCKETS)
+
+    def candidates(self, code, degree, signature):
+        if code < 0 or code >= len(self.by_label):
+            return np.zeros(0, dtype=np.int64)
+        nodes = self.by_label[code]
+        nodes = nodes[np.searchsorted(self.degrees[nodes], degree):]
+        return nodes[np.all(self.signatures[nodes] >= signature, axis=1)]
+
+    def neighbors(self, node):
+        return self.target.neighbors(node)
+
+    def neighbor_set(self, node):
+        # Built lazily: the search only looks at a small part of the target
+        neighbors = self.neighbor_sets.get(node)
+        if neighbors is None:
+            neighbors = self.neighbor_sets[node] = set(self.target.neighbors(node).tolist())
+        return neighbors
+
+
+def _search_order(pattern, candidate_counts):
+    # Most constrained node first, then repeatedly the node with the most
+    # neighbors already placed, fewest candidates and highest degree; a node
+    # with a placed neighbor takes its candidates from that neighbor's image.
+    degrees = pattern.degrees()
+    placed_neighbors = np.zeros(pattern.num_nodes, dtype=np.int64)
+    parent = np.full(pattern.num_nodes, -1, dtype=np.int64)
+    placed = np.zeros(pattern.num_nodes, dtype=bool)
+    order = []
+    for _ in range(pattern.num_nodes):
+        remaining = np.flatnonzero(~placed)
+        best = remaining[np.lexsort((-degrees[remaining], candidate_counts[remaining],
+                                     -placed_neighbors[remaining]))[0]]
+        order.append(int(best))
+        placed[best] = True
+        for neighbor in pattern.neighbors(best).tolist():
+            if not placed[neighbor]:
+                placed_neighbors[neighbor] += 1
+                if parent[neighbor] < 0:
+                    parent[neighbor] = best
+    return order, parent
+
+
+def subgraph_matches(pattern, target, use_labels=True, induced=True, distinct=True, label_key=None, index=None):
+    # Lazily yields every embedding of pattern in target as a dict from
+    # pattern node ids to target node ids. With induced=True target edges
+    # between matched nodes must also be pattern edges; otherwise only the
+    # pattern edges have to be present (monomorphism). With distinct=True
+    # embeddings covering an already reported set of target nodes, i.e.
+    # pattern automorphisms, are skipped. label_key maps label names to the
+    # values compared (see label_kind). Edge colors (direction, edge labels,
+    # parallel edges) are not compared: the search runs on the underlying
+    # simple graphs.
+    pattern = as_csr_graph(pattern)
+    if index is None:
+        index = TargetIndex(target, use_labels, label_key)
+    target = index.target
+    if pattern.num_nodes == 0 or pattern.num_nodes > target.num_nodes:
+        return
+    with phase('candidates'):
+        codes = index.label_codes(pattern, intern=False)
+        degrees = pattern.degrees()
+        signatures = index.neighbor_signatures(pattern, codes)
+        candidates = [index.candidates(codes[node], degrees[node], signatures[node])
+                      for node in range(pattern.num_nodes)]
+        candidate_counts = np.array([len(nodes) for nodes in candidates])
+        count('candidates', int(candidate_counts.sum()))
+        if np.any(candidate_counts == 0):
+            return
+        # Sorted by node for membership tests with searchsorted; a dense mask
+        # per pattern node would cost pattern times target memory
+        sorted_candidates = [np.sort(nodes) for nodes in candidates]
+
+    order, parent = _search_order(pattern, candidate_counts)
+    depth_of = np.empty(pattern.num_nodes, dtype=np.int64)
+    depth_of[order] = np.arange(pattern.num_nodes)
+    # For every depth: earlier depths that must be adjacent, and for induced
+    # matching earlier depths that must not be
+    adjacent = []
+    separate = []
+    loops = []
+    for depth, node in enumerate(order):
+        neighbors = set(pattern.neighbors(node).tolist())
+        adjacent.append([depth_of[other] for other in neighbors if depth_of[other] < depth])
+        separate.append([earlier for earlier in range(depth) if order[earlier] not in neighbors] if induced else [])
+        loops.append(node in neighbors)
+    parent_depth = [int(depth_of[parent[node]]) if parent[node] >= 0 else -1 for node in order]
+
+    pattern_ids = pattern.node_id_list()
+    target_ids = target.node_id_list()
+    images = [-1] * pattern.num_nodes
+    used = set()
+    # One key per distinct match yielded, so with distinct=True memory grows
+    # like the list of all matches would; distinct=False keeps none
+    seen = set()
+    # Counters are handed to the recorder whenever the generator yields or
+    # finishes, since the caller may stop iterating at any match
+    search_nodes = pruned = 0
+    counted = [0, 0]
+
+    def flush_counts():
+        count('search nodes', search_nodes - counted[0])
+        count('pruned branches', pruned - counted[1])
+        counted[:] = search_nodes, pruned
+
+    stack = []
+    depth = 0
+    while True:
+        if len(stack) == depth:
+            node = order[depth]
+            if parent_depth[depth] >= 0:
+                pool = index.neighbors(images[parent_depth[depth]])
+                allowed = sorted_candidates[node]
+                positions = np.minimum(np.searchsorted(allowed, pool), len(allowed) - 1)
+                pool = pool[allowed[positions] == pool]
+            else:
+                pool = candidates[node]
+            stack.append(iter(pool.tolist()))
+        elif images[depth] >= 0:
+            used.discard(images[depth])
+            images[depth] = -1
+        for image in stack[depth]:
+            search_nodes += 1
+            if search_nodes & 1023 == 0:
+                report('search nodes', search_nodes)
+            if image in used:
+                continue
+            image_neighbors = index.neighbor_set(image)
+            if ((image in image_neighbors) != loops[depth] and (induced or loops[depth])
+                    or any(images[other] not in image_neighbors for other in adjacent[depth])
+                    or any(images[other] in image_neighbors for other in separate[depth])):
+                pruned += 1
+                continue
+            images[depth] = image
+            used.add(image)
+            break
+        else:
+            stack.pop()
+            depth -= 1
+            if depth < 0:
+                flush_counts()
+                return
+            continue
+        if depth + 1 < pattern.num_nodes:
+            depth += 1
+            continue
+        if distinct:
+            key = np.sort(np.array(images, dtype=np.int32)).tobytes()
+            if key in seen:
+                continue
+            seen.add(key)
+        flush_counts()
+        yield {pattern_ids[order[i]]: target_ids[images[i]] for i in range(pattern.num_nodes)}
+
+
+def find_subgraph(pattern, target, use_labels=True, induced=True, label_key=None, index=None):
+    return next(subgraph_matches(pattern, target, use_labels, induced, True, label_key, index), None)
+
+
+if __name__ == "__main__":
+    target = load_graph_from_json('graphs/graph.json')
+    index = TargetIndex(target, use_labels=False)
+    for name in ('graph_inv', 'graph_and'):
+        pattern = load_graph_from_json(f'graphs/{name}.json')
+        matches = list(subgraph_matches(pattern, target, use_labels=False, index=index))
+        print(f"{name}: {len(matches)} occurrences in graph.json (labels ignored)")
@@ -1,27 +1,195 @@
-import json
-import networkx as nx
-from networkx.algorithms import isomorphism
+import numpy as np
 
+from algos.bliss import canonical_mapping
+from algos.csr_graph import as_csr_graph, load_graph_from_json
+from algos.fingerprint import triangle_counts
+from algos.instrument import count, phase
+from algos.mapping import mapping_dict
+from algos.progress import report
+from algos.refinement import refine_until_stable
 
-def load_graph_from_json(file_path):
-    with open(file_path, 'r') as file:
-        data = json.load(file)
-    G = nx.Graph()
-    for node in data['nodes']:
-        G.add_node(node['id'], label=node['label'])
-    for edge in data['edges']:
-        G.add_edge(edge['source'], edge['target'])
-    return G
 
+# Search nodes allowed per graph node before the matcher gives up on plain
+# backtracking; a match without dead ends takes one per node
+SEARCH_BUDGET = 8
 
-def vf2_isomorphism(graph1, graph2):
-    return isomorphism.GraphMatcher(graph1, graph2)
+
+class VF2Matcher:
+    # VF2++-style backtracking over CSR graphs. Both graphs are first refined
+    # together to a stable coloring seeded with labels and per-node triangle
+    # counts, and a node may only be matched to nodes of the same color.
+    # The coloring is not refined again during the search, which is fast
+    # while candidates are few but exponential on e.g. regular graphs where
+    # wrong choices only show up deep down; past SEARCH_BUDGET search nodes
+    # per graph node the bijection is taken from the canonical labelings of
+    # both graphs, whose search prunes by automorphisms.
+    def __init__(self, graph1, graph2, use_labels=True):
+        self.graph1 = as_csr_graph(graph1)
+        self.graph2 = as_csr_graph(graph2)
+        self.use_labels = use_labels
+        self.search_nodes = 0
+        self.mapping = None
+
+    def _matching_order(self, colors, class_sizes):
+        # BFS from the rarest, highest-degree node of each component; each
+        # BFS level is ordered by connections into the order so far, then by
+        # color rarity and degree. parent[u] is a neighbor placed before u.
+        graph = self.graph1
+        adjacency = self.adjacency1
+        degrees = graph.degrees().tolist()
+        rarity = class_sizes[colors].tolist()
+        placed = [False] * graph.num_nodes
+        ordered = [False] * graph.num_nodes
+        parent = [-1] * graph.num_nodes
+        order = []
+        roots = sorted(range(graph.num_nodes), key=lambda node: (rarity[node], -degrees[node]))
+        for root in roots:
+            if placed[root]:
+                continue
+            placed[root] = True
+            level = [root]
+            while level:
+                level.sort(key=lambda node: (-sum(ordered[other] for other in adjacency[node]),
+                                             rarity[node], -degrees[node]))
+                order.extend(level)
+                next_level = []
+                for node in level:
+                    ordered[node] = True
+                    for neighbor in adjacency[node]:
+                        if not placed[neighbor]:
+                            placed[neighbor] = True
+                            parent[neighbor] = node
+                            next_level.append(neighbor)
+                level = next_level
+        return order, parent
+
+    def _feasible(self, node1, node2):
+        mapping1, mapping2 = self.mapping1, self.mapping2
+        neighbors1 = self.neighbor_sets1[node1]
+        neighbors2 = self.neighbor_sets2[node2]
+        if (node1 in neighbors1) != (node2 in neighbors2):
+            return False
+        edge_colors = self.edge_colors
+        if edge_colors and node1 in neighbors1 and neighbors1[node1] != neighbors2[node2]:
+            return False
+        matched = 0
+        for neighbor in self.adjacency1[node1]:
+            image = mapping1[neighbor]
+            if image >= 0:
+                if image not in neighbors2 or edge_colors and neighbors1[neighbor] != neighbors2[image]:
+                    return False
+                matched += 1
+        return matched == sum(1 for neighbor in self.adjacency2[node2] if mapping2[neighbor] >= 0)
+
+    def _candidates(self, node1, colors1, colors2, classes2, parent):
+        color = colors1[node1]
+        if parent[node1] >= 0:
+            pool = self.adjacency2[self.mapping1[parent[node1]]]
+        else:
+            pool = classes2[color]
+        return [node2 for node2 in pool if colors2[node2] == color and self.mapping2[node2] < 0]
+
+    @staticmethod
+    def _colored_neighbors(graph, adjacency, name_index):
+        colors, names = graph.edge_color_codes()
+        codes = np.array([name_index.setdefault(name, len(name_index)) for name in names], dtype=np.int64)
+        colors = codes[colors].tolist()
+        indptr = graph.indptr.tolist()
+        return [dict(zip(neighbors, colors[indptr[node]:indptr[node + 1]])) for node, neighbors in enumerate(adjacency)]
+
+    def match(self):
+        graph1, graph2 = self.graph1, self.graph2
+        if graph1.num_nodes != graph2.num_nodes or graph1.num_edges != graph2.num_edges:
+            return None
+        with phase('invariants'):
+            triangles1 = triangle_counts(graph1)
+            triangles2 = triangle_counts(graph2)
+        if not np.array_equal(np.sort(triangles1), np.sort(triangles2)):
+            return None
+        equivalent, _, colors1, colors2 = refine_until_stable(
+            graph1, graph2, use_labels=self.use_labels, node_invariants=(triangles1, triangles2))
+        if not equivalent:
+            return None
+        with phase('search'):
+            return self._search(colors1, colors2)
+
+    def _search(self, colors1, colors2):
+        graph1, graph2 = self.graph1, self.graph2
+        self.adjacency1 = [graph1.neighbors(node).tolist() for node in range(graph1.num_nodes)]
+        self.adjacency2 = [graph2.neighbors(node).tolist() for node in range(graph2.num_nodes)]
+        self.edge_colors = graph1.edge_colors is not None or graph2.edge_colors is not None
+        if self.edge_colors:
+            # Neighbor -> edge color, with codes shared by both graphs
+            name_index = {}
+            self.neighbor_sets1 = self._colored_neighbors(graph1, self.adjacency1, name_index)
+            self.neighbor_sets2 = self._colored_neighbors(graph2, self.adjacency2, name_index)
+        else:
+            self.neighbor_sets1 = [set(neighbors) for neighbors in self.adjacency1]
+            self.neighbor_sets2 = [set(neighbors) for neighbors in self.adjacency2]
+        class_sizes = np.bincount(colors1)
+        order, parent = self._matching_order(colors1, class_sizes)
+        colors1 = colors1.tolist()
+        colors2 = colors2.tolist()
+        classes2 = [[] for _ in range(len(class_sizes))]
+        for node2, color in enumerate(colors2):
+            classes2[color].append(node2)
+
+        self.mapping1 = [-1] * graph1.num_nodes
+        self.mapping2 = [-1] * graph2.num_nodes
+        stack = []
+        depth = 0
+        pruned = 0
+        budget = SEARCH_BUDGET * graph1.num_nodes + 1024
+        while depth < len(order):
+            node1 = order[depth]
+            if len(stack) == depth:
+                stack.append(iter(self._candidates(node1, colors1, colors2, classes2, parent)))
+            elif self.mapping1[node1] >= 0:
+                self.mapping2[self.mapping1[node1]] = -1
+                self.mapping1[node1] = -1
+            for node2 in stack[depth]:
+                self.search_nodes += 1
+                if self.search_nodes & 1023 == 0:
+                    report('search nodes', self.search_nodes)
+                    if self.search_nodes > budget:
+                        count('search nodes', self.search_nodes)
+                        count('pruned branches', pruned)
+                        self.mapping = mapping_dict(graph1, graph2,
+                                                    canonical_mapping(graph1, graph2, self.use_labels))
+                        return self.mapping
+                if self._feasible(node1, node2):
+                    self.mapping1[node1] = node2
+                    self.mapping2[node2] = node1
+                    depth += 1
+                    break
+                pruned += 1
+            else:
+                stack.pop()
+                depth -= 1
+                if depth < 0:
+                    count('search nodes', self.search_nodes)
+                    count('pruned branches', pruned)
+                    return None
+        count('search nodes', self.search_nodes)
+        count('pruned branches', pruned)
+        node_ids1 = graph1.node_id_list()
+        node_ids2 = graph2.node_id_list()
+        self.mapping = {node_ids1[node1]: node_ids2[node2] for node1, node2 in enumerate(self.mapping1)}
+        return self.mapping
+
+
+def vf2_mapping(graph1, graph2, use_labels=True):
+    return VF2Matcher(graph1, graph2, use_labels).match()
+
+
+def vf2_isomorphism(graph1, graph2, use_labels=True):
+    return vf2_mapping(graph1, graph2, use_labels) is not None
 
 
 if __name__ == "__main__":
     graph1 = load_graph_from_json('graphs/graph.json')
     graph2 = load_graph_from_json('graphs/el_graph.json')
-    
-    is_isomorphic = isomorphism.GraphMatcher(graph1, graph2)
-    
+
+    is_isomorphic = vf2_isomorphism(graph1, graph2)
+
     print("Graphs are isomorphic" if is_isomorphic else "Graphs are not isomorphic")
@@ -0,0 +1,392 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import multiprocessing
+import numpy as np
+
+from timeit import default_timer as timer
+
+# Local imports
+from algos.checkers import CHECKERS
+from algos.csr_graph import load_graph_from_json
+from modules.generate_random_graph import (cfi_pair, erdos_renyi_graph, latin_square_graph, permuted_twin,
+                                           perturbed_twin, power_law_graph, random_regular_graph)
+
+
+BENCHMARK_VERSION = 1
+DEFAULT_REPEATS = 5
+DEFAULT_WARMUP = 1
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_THRESHOLD = 0.25
+# Slowdowns smaller than this many seconds are treated as timer noise
+NOISE_FLOOR = 0.002
+IMPORT_NOISE_FLOOR = 0.02
+
+# Modules whose import time is measured, each in a fresh interpreter; the
+# core should not pull in any of HEAVY_MODULES
+IMPORT_MODULES = ('numpy', 'algos', 'algos.csr_graph', 'algos.checkers', 'algos.service')
+HEAVY_MODULES = ('networkx', 'matplotlib', 'customtkinter')
+DEFAULT_IMPORT_REPEATS = 5
+
+_IMPORT_SCRIPT = '''
+import sys, json, importlib
+from time import perf_counter
+start_time = perf_counter()
+importlib.import_module(sys.argv[1])
+seconds = perf_counter() - start_time
+print(json.dumps({'seconds': seconds, 'heavy': [name for name in sys.argv[2:] if name in sys.modules]}))
+'''
+
+# Shipped pairs compared as they are; their expected verdict is unknown
+BUNDLED_PAIRS = (('graph.json', 'el_graph.json'), ('graph_and.json', 'el_graph_and.json'),
+                 ('graph_inv.json', 'el_graph_inv.json'))
+
+
+# Instance builders. Every family builds (graph1, graph2, expected) triples
+# for an isomorphic and a non-isomorphic pair at a given size.
+
+def _pairs(graph, rng, preserve_degrees=False):
+    return ((graph, permuted_twin(graph, rng), True),
+            (graph, perturbed_twin(graph, rng, preserve_degrees), False))
+
+
+def random_family(size, rng):
+    return _pairs(erdos_renyi_graph(size, 4, num_labels=4, seed=rng), rng)
+
+
+def power_law_family(size, rng):
+    return _pairs(power_law_graph(size, seed=rng), rng)
+
+
+def regular_family(size, rng):
+    return _pairs(random_regular_graph(size, 3, rng), rng, preserve_degrees=True)
+
+
+def strongly_regular_family(size, rng):
+    # Latin square graphs of the cyclic and the elementary abelian group of
+    # order 2^k: same parameters, not isomorphic
+    order = 1 << max(3, int(np.log2(max(size, 64))) // 2)
+    cyclic = latin_square_graph(order, 'cyclic')
+    elementary = latin_square_graph(order, 'elementary_abelian')
+    return ((cyclic, permuted_twin(cyclic, rng), True), (cyclic, permuted_twin(elementary, rng), False))
+
+
+def cfi_family(size, rng):
+    # Colored CFI pairs over random cubic base graphs with about size / 10
+    # vertices, which color refinement cannot tell apart
+    graph, twisted = cfi_pair(max(4, size // 20 * 2), seed=rng)
+    return ((graph, permuted_twin(graph, rng), True), (graph, permuted_twin(twisted, rng), False))
+
+
+def bundled_family(_, rng, directory='graphs'):
+    pairs = []
+    for name1, name2 in BUNDLED_PAIRS:
+        graph1 = load_graph_from_json(os.path.join(directory, name1))
+        graph2 = load_graph_from_json(os.path.join(directory, name2))
+        pairs.append((graph1, graph2, None))
+        pairs.extend(_pairs(graph1, rng))
+    return pairs
+
+
+# name: (builder, default sizes in nodes)
+FAMILIES = {
+    'bundled': (bundled_family, (0,)),
+    'random': (random_family, (100, 1000, 10000, 100000)),
+    'power_law': (power_law_family, (100, 1000, 10000, 100000)),
+    'regular': (regular_family, (100, 1000, 10000)),
+    'strongly_regular': (strongly_regular_family, (64, 256, 1024)),
+    'cfi': (cfi_family, (80, 160, 320)),
+}
+
+
+def _peak_rss_bytes():
+    # VmHWM after it was reset by _reset_peak_rss; ru_maxrss elsewhere
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+
+def time_runs(function, graph1, graph2, repeats=DEFAULT_REPEATS, warmup=DEFAULT_WARMUP):
+    for _ in range(warmup):
+        function(graph1, graph2)
+    times = []
+    for _ in range(repeats):
+        start_time = timer()
+        verdict = function(graph1, graph2)
+        times.append(timer() - start_time)
+    return bool(verdict), times
+
+
+def summarize(times):
+    times = np.array(times)
+    return {'median': float(np.median(times)), 'p95': float(np.percentile(times, 95)),
+            'min': float(times.min()), 'runs': len(times)}
+
+
+def _measure(connection, checker, graph1, graph2, repeats, warmup):
+    _reset_peak_rss()
+    try:
+        verdict, times = time_runs(CHECKERS[checker], graph1, graph2, repeats, warmup)
+        connection.send({'status': 'ok', 'verdict': verdict, 'times': times, 'peak_rss': _peak_rss_bytes()})
+    except Exception as error:
+        connection.send({'status': 'error', 'error': repr(error)})
+
+
+def measure(checker, graph1, graph2, repeats=DEFAULT_REPEATS, warmup=DEFAULT_WARMUP, timeout=DEFAULT_TIMEOUT):
+    # Each measurement runs in a fresh child process, which isolates its
+    # peak RSS and lets it be killed once its runs take longer than timeout
+    # seconds each on average.
+    method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+    context = multiprocessing.get_context(method)
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure, args=(sender, checker, graph1, graph2, repeats, warmup))
+    process.start()
+    sender.close()
+    if receiver.poll(timeout * (warmup + repeats)):
+        result = receiver.recv()
+    else:
+        process.terminate()
+        result = {'status': 'timeout'}
+    process.join()
+    receiver.close()
+    return result
+
+
+def time_import(module, repeats=DEFAULT_IMPORT_REPEATS):
+    # Import time inside a fresh interpreter, and the wall time of the whole
+    # process (interpreter startup included), as a short CLI run sees it
+    directory = os.path.dirname(os.path.abspath(__file__))
+    import_times = []
+    process_times = []
+    heavy = set()
+    for _ in range(repeats):
+        start_time = timer()
+        output = subprocess.run([sys.executable, '-c', _IMPORT_SCRIPT, module, *HEAVY_MODULES], cwd=directory,
+                                capture_output=True, text=True, check=True).stdout
+        process_times.append(timer() - start_time)
+        result = json.loads(output)
+        import_times.append(result['seconds'])
+        heavy.update(result['heavy'])
+    row = {'module': module, 'heavy': sorted(heavy)}
+    row.update(summarize(import_times))
+    row['process_median'] = float(np.median(process_times))
+    return row
+
+
+def run_import_suite(modules=IMPORT_MODULES, repeats=DEFAULT_IMPORT_REPEATS, log=print):
+    rows = []
+    for module in modules:
+        row = time_import(module, repeats)
+        rows.append(row)
+        log(format_import_row(row))
+    return rows
+
+
+def format_import_row(row):
+    return (f"{row['module']:<17} {row['median']:>11.6f} {row['p95']:>11.6f} {row['process_median']:>11.6f} "
+            f"{', '.join(row['heavy']) or '-'}")
+
+
+def run_suite(families=None, checkers=None, sizes=None, repeats=DEFAULT_REPEATS, warmup=DEFAULT_WARMUP,
+              timeout=DEFAULT_TIMEOUT, seed=0, log=print):
+    # Sizes grow per family; a checker that times out or fails on a pair is
+    # skipped for the larger sizes of the same family and pair kind.
+    checkers = list(checkers or CHECKERS)
+    results = []
+    for family in families or FAMILIES:
+        builder, default_sizes = FAMILIES[family]
+        given_up = set()
+        for size in (sizes or default_sizes) if family != 'bundled' else default_sizes:
+            rng = np.random.default_rng(seed)
+            for graph1, graph2, expected in builder(size, rng):
+                pair = {True: 'isomorphic', False: 'non-isomorphic', None: 'shipped'}[expected]
+                for checker in checkers:
+                    row = {'family': family, 'size': size, 'pair': pair, 'checker': checker,
+                           'nodes': graph1.num_nodes, 'edges': graph1.num_edges, 'expected': expected}
+                    if (checker, pair) in given_up:
+                        row['status'] = 'skipped'
+                    else:
+                        result = measure(checker, graph1, graph2, repeats, warmup, timeout)
+                        row['status'] = result['status']
+                        if result['status'] == 'ok':
+                            row['verdict'] = result['verdict']
+                            row['correct'] = None if expected is None else result['verdict'] == expected
+                            row['peak_rss_mb'] = (None if result['peak_rss'] is None
+                                                  else result['peak_rss'] / 2 ** 20)
+                            row.update(summarize(result['times']))
+                        else:
+                            given_up.add((checker, pair))
+                            row['error'] = result.get('error')
+                    results.append(row)
+                    log(format_row(row))
+    return results
+
+
+def format_row(row):
+    if row['status'] != 'ok':
+        return (f"{row['family']:<17} {row['nodes']:>8} {row['pair']:<15} {row['checker']:<18} "
+                f"{row['status']}")
+    correct = {True: 'ok', False: 'WRONG', None: '-'}[row['correct']]
+    rss = '-' if row['peak_rss_mb'] is None else f"{row['peak_rss_mb']:.1f}"
+    return (f"{row['family']:<17} {row['nodes']:>8} {row['pair']:<15} {row['checker']:<18} "
+            f"{str(row['verdict']):<6} {correct:<6} {row['median']:>11.6f} {row['p95']:>11.6f} {rss:>9}")
+
+
+def scaling_report(results):
+    # Empirical exponent k of median time ~ (nodes + edges)^k per checker.
+    # Generators may round several requested sizes to the same graph size
+    # (e.g. latin squares), so each size contributes the median of its
+    # times; curves with fewer than two distinct sizes have no slope.
+    curves = {}
+    for row in results:
+        if row['status'] == 'ok' and row['family'] != 'bundled' and row['median'] > 0:
+            key = (row['family'], row['pair'], row['checker'])
+            curves.setdefault(key, {}).setdefault(row['nodes'] + row['edges'], []).append(row['median'])
+    lines = []
+    for (family, pair, checker), points in curves.items():
+        if len(points) < 2:
+            continue
+        sizes = np.log(np.array(sorted(points), dtype=np.float64))
+        medians = np.log([np.median(points[size]) for size in sorted(points)])
+        exponent = np.polyfit(sizes, medians, 1)[0]
+        lines.append(f"{family:<17} {pair:<15} {checker:<18} ~ n^{exponent:.2f}")
+    return lines
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(results, file_path, settings, imports=None):
+    document = {
+        'version': BENCHMARK_VERSION,
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'settings': settings,
+        'results': results,
+        'imports': imports or [],
+    }
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(file_path, 'w') as file:
+        json.dump(document, file, indent=4)
+
+
+def compare_results(baseline, results, threshold=DEFAULT_THRESHOLD):
+    # Regressions are medians slower by more than threshold, correctness
+    # losses, and runs that no longer finish.
+    previous = {(row['family'], row['nodes'], row['pair'], row['checker']): row for row in baseline['results']}
+    regressions = []
+    for row in results:
+        old = previous.get((row['family'], row['nodes'], row['pair'], row['checker']))
+        if old is None:
+            continue
+        name = f"{row['family']} {row['nodes']} {row['pair']} {row['checker']}"
+        if old['status'] == 'ok' and row['status'] != 'ok':
+            regressions.append(f"{name}: {row['status']} (was ok)")
+        elif old['status'] == 'ok' and row['status'] == 'ok':
+            if old['correct'] is not False and row['correct'] is False:
+                regressions.append(f"{name}: verdict became wrong")
+            if row['median'] > old['median'] * (1 + threshold) and row['median'] - old['median'] > NOISE_FLOOR:
+                regressions.append(f"{name}: median {old['median']:.6f}s -> {row['median']:.6f}s "
+                                   f"({row['median'] / old['median']:.2f}x)")
+    return regressions
+
+
+def compare_imports(baseline, imports, threshold=DEFAULT_THRESHOLD):
+    # Slower imports, and heavy modules that a module did not pull in before
+    previous = {row['module']: row for row in baseline.get('imports', [])}
+    regressions = []
+    for row in imports:
+        old = previous.get(row['module'])
+        if old is None:
+            continue
+        name = f"import {row['module']}"
+        for module in sorted(set(row['heavy']) - set(old['heavy'])):
+            regressions.append(f"{name}: now loads {module}")
+        if row['median'] > old['median'] * (1 + threshold) and row['median'] - old['median'] > IMPORT_NOISE_FLOOR:
+            regressions.append(f"{name}: median {old['median']:.6f}s -> {row['median']:.6f}s "
+                               f"({row['median'] / old['median']:.2f}x)")
+    return regressions
+
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description='Benchmark the isomorphism checkers over graph families.')
+    parser.add_argument('--families', nargs='+', choices=list(FAMILIES), default=list(FAMILIES))
+    parser.add_argument('--checkers', nargs='+', choices=list(CHECKERS), default=list(CHECKERS))
+    parser.add_argument('--sizes', nargs='+', type=int, help='node counts overriding the family defaults')
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS)
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='seconds allowed per run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=os.path.join('benchmarks', f"results-{time.strftime('%Y%m%d-%H%M%S')}.json"))
+    parser.add_argument('--compare', help='earlier results file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed relative slowdown of the median before it counts as a regression')
+    parser.add_argument('--import-repeats', type=int, default=DEFAULT_IMPORT_REPEATS,
+                        help='fresh interpreters per module for the import times; 0 skips them')
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    options = parse_arguments(arguments)
+    imports = []
+    if options.import_repeats > 0:
+        print(f"{'module':<17} {'import s':>11} {'p95 s':>11} {'process s':>11} heavy modules")
+        imports = run_import_suite(repeats=options.import_repeats)
+        print()
+    print(f"{'family':<17} {'nodes':>8} {'pair':<15} {'checker':<18} {'result':<6} {'check':<6} "
+          f"{'median s':>11} {'p95 s':>11} {'peak MB':>9}")
+    results = run_suite(options.families, options.checkers, options.sizes, options.repeats, options.warmup,
+                        options.timeout, options.seed)
+    print("\nScaling:")
+    for line in scaling_report(results):
+        print(line)
+    settings = {name: getattr(options, name) for name in ('families', 'checkers', 'sizes', 'repeats', 'warmup',
+                                                          'timeout', 'seed', 'import_repeats')}
+    save_results(results, options.output, settings, imports)
+    print(f"\nResults saved to {options.output}")
+    if options.compare:
+        with open(options.compare) as file:
+            baseline = json.load(file)
+        regressions = (compare_imports(baseline, imports, options.threshold) +
+                       compare_results(baseline, results, options.threshold))
+        print(f"\n{len(regressions)} regression(s) against {options.compare}")
+        for line in regressions:
+            print(line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,38 +1,399 @@
+import os
+import sys
 import json
-import random
-
-def generate_random_graph(num_nodes):
-    nodes = [{"id": i + 1, "label": chr(65 + i)} for i in range(num_nodes)]
-    
-    edges = set()
-    for i in range(num_nodes):
-        while True:
-            target = random.randint(1, num_nodes)
-            if target != i + 1:
-                edges.add((min(i + 1, target), max(i + 1, target)))
-                break
-
-    for _ in range(random.randint(0, num_nodes)):
-        source = random.randint(1, num_nodes)
-        target = random.randint(1, num_nodes)
-        if source != target:
-            edges.add((min(source, target), max(source, target)))
-
-    edges = [{"source": source, "target": target} for source, target in edges]
-
-    graph = {
-        "nodes": nodes,
-        "edges": edges
-    }
-
-    return graph
+import argparse
+import numpy as np
+
+if not __package__:
+    # Run as a script, python modules/generate_random_graph.py: the algos
+    # package sits next to modules/ rather than on the path
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algos.csr_graph import CSRGraph
+from algos.fingerprint import triangle_counts
+from algos.binary_graph import EXTENSION, save_binary_graph
+
+
+# All generators build the edge list in bulk with NumPy from a seeded
+# Generator (seed may be an int, None or a np.random.Generator) and return
+# CSRGraphs with node ids 0..n-1.
+
+def _rng(seed):
+    return seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+
+
+def _graph(labels, label_names, sources, targets, node_ids=None, *edge_data):
+    # edge_data optionally holds from_arrays' edge_labels, edge_label_names,
+    # directed and multigraph
+    labels = np.asarray(labels, dtype=np.int32)
+    node_ids = np.arange(len(labels)) if node_ids is None else node_ids
+    return CSRGraph.from_arrays(node_ids, labels, list(label_names), sources, targets, *edge_data)
+
+
+def _edge_arrays(graph):
+    # (sources, targets, edge_data) of the original edges, where edge_data
+    # carries the edge labels and flags of a directed, edge-labelled or
+    # multigraph for _graph and is empty for a plain graph. A multigraph
+    # without parallel edges has no edge_colors but keeps its flag.
+    if graph.edge_colors is None and not graph.directed and not graph.multigraph:
+        return (*graph.edges(), ())
+    sources, targets, edge_labels = graph.edge_list()
+    label_index = {}
+    codes = np.fromiter((label_index.setdefault(label, len(label_index)) for label in edge_labels),
+                        dtype=np.int64, count=len(edge_labels))
+    return (np.array(sources, dtype=np.int64), np.array(targets, dtype=np.int64),
+            (codes, list(label_index), graph.directed, graph.multigraph))
+
+
+def _random_labels(num_nodes, num_labels, rng):
+    if num_labels <= 1:
+        return np.zeros(num_nodes, dtype=np.int32), ['']
+    return rng.integers(0, num_labels, num_nodes, dtype=np.int32), [f'L{label}' for label in range(num_labels)]
+
+
+def generate_random_graph(num_nodes, seed=None):
+    # Every node gets one random edge, plus up to num_nodes extra random
+    # edges; each node has its own label.
+    rng = _rng(seed)
+    nodes = np.arange(num_nodes)
+    targets = (nodes + rng.integers(1, max(num_nodes, 2), num_nodes)) % max(num_nodes, 1)
+    num_extra = int(rng.integers(0, num_nodes + 1))
+    extra_sources = rng.integers(0, num_nodes, num_extra)
+    extra_targets = rng.integers(0, num_nodes, num_extra)
+    mask = extra_sources != extra_targets
+    sources = np.concatenate((nodes, extra_sources[mask]))
+    targets = np.concatenate((targets, extra_targets[mask]))
+    return _graph(nodes, [f'N{node}' for node in range(num_nodes)], sources, targets)
+
+
+def erdos_renyi_graph(num_nodes, average_degree=4.0, num_labels=1, seed=None):
+    # G(n, m) with m = n * average_degree / 2 endpoint pairs drawn at once;
+    # self-loops are dropped and repeated pairs merge.
+    rng = _rng(seed)
+    num_edges = int(num_nodes * average_degree / 2)
+    sources = rng.integers(0, num_nodes, num_edges)
+    targets = rng.integers(0, num_nodes, num_edges)
+    mask = sources != targets
+    labels, label_names = _random_labels(num_nodes, num_labels, rng)
+    return _graph(labels, label_names, sources[mask], targets[mask])
+
+
+def _switch_to_simple(sources, targets, num_nodes, rng):
+    # Repairs self-loops and repeated edges of a pairing by switching each
+    # bad edge (u, v) with a random edge (x, y) into (u, x), (v, y), which
+    # keeps every degree. Rounds repeat until the pairing is simple.
+    while True:
+        keys = np.minimum(sources, targets) * num_nodes + np.maximum(sources, targets)
+        _, first = np.unique(keys, return_index=True)
+        bad = np.ones(len(keys), dtype=bool)
+        bad[first] = False
+        bad |= sources == targets
+        bad = np.flatnonzero(bad)
+        if len(bad) == 0:
+            return sources, targets
+        partners = rng.integers(0, len(sources), len(bad))
+        valid = partners != bad
+        bad, partners = bad[valid], partners[valid]
+        _, unique = np.unique(np.concatenate((bad, partners)), return_index=True)
+        if len(unique) < 2 * len(bad):
+            # An edge drawn twice in one round is only switched once
+            taken = np.zeros(len(sources), dtype=bool)
+            keep = []
+            for index, (edge, partner) in enumerate(zip(bad.tolist(), partners.tolist())):
+                if not taken[edge] and not taken[partner]:
+                    taken[edge] = taken[partner] = True
+                    keep.append(index)
+            bad, partners = bad[keep], partners[keep]
+        sources[bad], targets[bad], sources[partners], targets[partners] = (
+            sources[bad].copy(), sources[partners].copy(), targets[bad].copy(), targets[partners].copy())
+
+
+def random_regular_graph(num_nodes, degree=3, seed=None):
+    # Configuration model: a random pairing of degree stubs per node,
+    # switched until simple
+    if num_nodes * degree % 2 or degree >= num_nodes:
+        raise ValueError(f'no simple {degree}-regular graph on {num_nodes} nodes')
+    rng = _rng(seed)
+    stubs = rng.permutation(np.repeat(np.arange(num_nodes), degree)).reshape(-1, 2)
+    sources, targets = _switch_to_simple(stubs[:, 0].copy(), stubs[:, 1].copy(), num_nodes, rng)
+    return _graph(np.zeros(num_nodes), [''], sources, targets)
+
+
+def power_law_graph(num_nodes, exponent=2.5, average_degree=4.0, num_labels=1, seed=None):
+    # Chung-Lu graph: endpoints drawn with probability proportional to
+    # weights w_i ~ (i + 1)^(-1 / (exponent - 1)), so expected degrees follow
+    # a power law with the given exponent.
+    rng = _rng(seed)
+    weights = np.arange(1, num_nodes + 1, dtype=np.float64) ** (-1 / (exponent - 1))
+    cumulative = np.cumsum(weights)
+    num_edges = int(num_nodes * average_degree / 2)
+    sources = np.searchsorted(cumulative, rng.random(num_edges) * cumulative[-1])
+    targets = np.searchsorted(cumulative, rng.random(num_edges) * cumulative[-1])
+    mask = sources != targets
+    labels, label_names = _random_labels(num_nodes, num_labels, rng)
+    permutation = rng.permutation(num_nodes)
+    return _graph(labels, label_names, permutation[sources[mask]], permutation[targets[mask]])
+
+
+def latin_square_graph(order, group='cyclic'):
+    # Cells of the Cayley table of a group of the given order, adjacent when
+    # they share a row, a column or a symbol: strongly regular with
+    # parameters (n^2, 3(n - 1), n, 6) whatever the group. For order 2^k,
+    # k >= 3, the 'cyclic' and 'elementary_abelian' graphs are not isomorphic.
+    rows, columns = np.indices((order, order))
+    if group == 'cyclic':
+        symbols = (rows + columns) % order
+    elif group == 'elementary_abelian' and order & (order - 1) == 0:
+        symbols = rows ^ columns
+    else:
+        raise ValueError(f'no {group} group of order {order}')
+    cells = np.arange(order * order)
+    groups = (cells.reshape(order, order), cells.reshape(order, order).T,
+              cells[np.argsort(symbols.ravel(), kind='stable')].reshape(order, order))
+    first, second = np.triu_indices(order, 1)
+    sources = np.concatenate([cell_group[:, first].ravel() for cell_group in groups])
+    targets = np.concatenate([cell_group[:, second].ravel() for cell_group in groups])
+    return _graph(np.zeros(order * order), [''], sources, targets)
+
+
+def cfi_graph(base, twisted=False, colored=True):
+    # Cai-Furer-Immerman construction over the edges of base. Each base
+    # vertex v becomes one middle node per even-size subset of its incident
+    # edges and two end nodes (v, e, 0) and (v, e, 1) per incident edge e;
+    # a middle node is joined to end bit 1 of the edges in its subset and to
+    # end bit 0 of the others. The end nodes of base edge (u, v) are joined
+    # bit to bit, crossed on the first edge when twisted. The plain and the
+    # twisted graph are not isomorphic when that edge lies in a connected
+    # base graph, yet color refinement cannot tell them apart. colored gives
+    # every gadget its own labels, as in the classic construction.
+    base_sources, base_targets = base.edges()
+    if np.any(base_sources == base_targets):
+        raise ValueError('CFI base graph must not have self-loops')
+    num_base = base.num_nodes
+    num_base_edges = len(base_sources)
+
+    # Incidences (v, e) sorted by vertex; incidence i owns end nodes 2i, 2i + 1
+    vertices = np.concatenate((base_sources, base_targets)).astype(np.int64)
+    base_edges = np.tile(np.arange(num_base_edges), 2)
+    order = np.lexsort((base_edges, vertices))
+    vertices, base_edges = vertices[order], base_edges[order]
+    incidence = np.empty(2 * num_base_edges, dtype=np.int64)
+    incidence[order] = np.arange(2 * num_base_edges)
+    degrees = np.bincount(vertices, minlength=num_base)
+    first_incidence = np.concatenate(([0], np.cumsum(degrees)[:-1]))
+    num_ends = 4 * num_base_edges
+
+    # Middle nodes: 2^(d - 1) per vertex of degree d >= 1, one for d == 0
+    num_middles = np.where(degrees > 0, np.left_shift(1, np.maximum(degrees - 1, 0)), 1)
+    first_middle = num_ends + np.concatenate(([0], np.cumsum(num_middles)[:-1]))
+    sources = []
+    targets = []
+    for degree in np.unique(degrees[degrees > 0]).tolist():
+        group = np.flatnonzero(degrees == degree)
+        subsets = np.arange(1 << degree)
+        subsets = subsets[np.array([bin(subset).count('1') % 2 == 0 for subset in subsets.tolist()])]
+        bits = (subsets[:, None] >> np.arange(degree)) & 1
+        middles = first_middle[group][:, None, None] + np.arange(len(subsets))[None, :, None]
+        ends = 2 * (first_incidence[group][:, None, None] + np.arange(degree)[None, None, :]) + bits[None, :, :]
+        middles, ends = np.broadcast_arrays(middles, ends)
+        sources.append(middles.ravel())
+        targets.append(ends.ravel())
+    twist = np.zeros(num_base_edges, dtype=np.int64)
+    if twisted and num_base_edges:
+        twist[0] = 1
+    for bit in (0, 1):
+        sources.append(2 * incidence[:num_base_edges] + bit)
+        targets.append(2 * incidence[num_base_edges:] + (bit ^ twist))
+
+    num_nodes = num_ends + int(num_middles.sum())
+    if colored:
+        end_labels = np.repeat(np.arange(2 * num_base_edges), 2)
+        middle_labels = 2 * num_base_edges + np.repeat(np.arange(num_base), num_middles)
+        labels = np.concatenate((end_labels, middle_labels))
+        label_names = ([f'a{v}.{e}' for v, e in zip(vertices.tolist(), base_edges.tolist())] +
+                       [f'm{v}' for v in range(num_base)])
+    else:
+        labels = np.zeros(num_nodes)
+        label_names = ['']
+    return _graph(labels, label_names, np.concatenate(sources), np.concatenate(targets))
+
+
+def cfi_pair(num_base, degree=3, seed=None, colored=True):
+    # Plain and twisted CFI graphs over a random connected regular base graph
+    rng = _rng(seed)
+    while True:
+        base = random_regular_graph(num_base, degree, rng)
+        if _connected(base):
+            return cfi_graph(base, False, colored), cfi_graph(base, True, colored)
+
+
+def _connected(graph):
+    seen = np.zeros(graph.num_nodes, dtype=bool)
+    seen[0] = True
+    frontier = np.array([0])
+    while len(frontier):
+        neighbors = np.concatenate([graph.neighbors(node) for node in frontier.tolist()])
+        frontier = np.unique(neighbors[~seen[neighbors]])
+        seen[frontier] = True
+    return bool(seen.all())
+
+
+def permuted_twin(graph, seed=None):
+    # Same node ids and structure under a uniformly random relabelling:
+    # the node at index permutation[i] takes the label and edges of node i.
+    # Edge labels, directions and parallel edges are kept.
+    rng = _rng(seed)
+    permutation = rng.permutation(graph.num_nodes)
+    labels = np.empty_like(graph.labels)
+    labels[permutation] = graph.labels
+    sources, targets, edge_data = _edge_arrays(graph)
+    return _graph(labels, graph.label_names, permutation[sources], permutation[targets], graph.node_ids, *edge_data)
+
+
+def _has_edges(sorted_keys, num_nodes, sources, targets):
+    keys = np.minimum(sources, targets).astype(np.int64) * num_nodes + np.maximum(sources, targets)
+    slots = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return sorted_keys[slots] == keys
+
+
+def _moved_edge(graph, rng):
+    # Moves one edge (u, v) to (u, w). Unless w had degree deg(v) - 1 the
+    # degree multiset changes, which makes the result non-isomorphic.
+    sources, targets = graph.edges()
+    degrees = graph.degrees()
+    for edge in rng.permutation(len(sources)).tolist():
+        u, v = int(sources[edge]), int(targets[edge])
+        if u == v:
+            continue
+        for _ in range(16):
+            w = int(rng.integers(graph.num_nodes))
+            if w != u and degrees[w] != degrees[v] - 1 and w not in graph.neighbors(u):
+                keep = np.arange(len(sources)) != edge
+                return np.append(sources[keep], u), np.append(targets[keep], w)
+    raise ValueError('graph has no edge that can be moved')
+
+
+def _swapped_edges(graph, rng):
+    # Degree-preserving double edge swap (a, b), (c, d) -> (a, d), (c, b)
+    # where a and d share a neighbor, retried until the triangle count
+    # changes, which makes the result non-isomorphic.
+    triangles = int(triangle_counts(graph).sum())
+    sources, targets = graph.edges()
+    sorted_keys = sources.astype(np.int64) * graph.num_nodes + targets
+    degrees = graph.degrees()
+    candidates = np.flatnonzero(degrees >= 2)
+    for _ in range(100 * len(candidates)):
+        middle = int(rng.choice(candidates))
+        a, d = (int(node) for node in rng.choice(graph.neighbors(middle), 2, replace=False))
+        b = int(rng.choice(graph.neighbors(a)))
+        c = int(rng.choice(graph.neighbors(d)))
+        if len({a, b, c, d, middle}) < 5 or _has_edges(sorted_keys, graph.num_nodes, np.array([a, c]),
+                                                        np.array([d, b])).any():
+            continue
+        removed = np.searchsorted(sorted_keys, [min(a, b) * graph.num_nodes + max(a, b),
+                                                min(c, d) * graph.num_nodes + max(c, d)])
+        keep = np.ones(len(sources), dtype=bool)
+        keep[removed] = False
+        swapped = (np.append(sources[keep], (a, c)), np.append(targets[keep], (d, b)))
+        candidate = _graph(graph.labels, graph.label_names, *swapped)
+        if int(triangle_counts(candidate).sum()) != triangles:
+            return swapped
+    raise ValueError('no degree-preserving swap changes the triangle count')
+
+
+def perturbed_twin(graph, seed=None, preserve_degrees=False):
+    # A permuted copy of graph with one minimal change that is guaranteed to
+    # break isomorphism: one edge moved so the degree multiset changes, or
+    # with preserve_degrees a double edge swap that changes the triangle
+    # count (hard for degree-based filters, e.g. on regular graphs).
+    if graph.edge_colors is not None or graph.directed or graph.multigraph:
+        raise ValueError('perturbed_twin only changes undirected graphs without edge labels or parallel edges')
+    rng = _rng(seed)
+    sources, targets = _swapped_edges(graph, rng) if preserve_degrees else _moved_edge(graph, rng)
+    return permuted_twin(_graph(graph.labels, graph.label_names, sources, targets, graph.node_ids), rng)
+
+
+def _write_items(file, template, rows, chunk_size=1 << 16):
+    for start in range(0, len(rows), chunk_size):
+        file.write(('' if start == 0 else ',') + ','.join(template % row for row in rows[start:start + chunk_size]))
+
 
 def save_graph_to_json(graph, filename):
+    # Writes a CSRGraph in the pretty-printed layout of graphs/*.json in
+    # chunks, without building the document in memory; plain dicts are
+    # dumped as they are. A directed, edge-labelled or multigraph also gets
+    # the 'directed' and 'multigraph' flags and a 'label' on every edge.
+    if not isinstance(graph, CSRGraph):
+        with open(filename, 'w') as file:
+            json.dump(graph, file, indent=4)
+        return
+    if isinstance(graph.node_ids, np.ndarray) and graph.node_ids.dtype.kind in 'iu':
+        node_ids = list(map(str, graph.node_ids.tolist()))
+    else:
+        node_ids = [json.dumps(node_id) for node_id in graph.node_id_list()]
+    label_names = [json.dumps(str(name)) for name in graph.label_names]
+    sources, targets, edge_data = _edge_arrays(graph)
+    edge_template = '\n        {\n            "source": %s,\n            "target": %s\n        }'
+    edges = [(node_ids[source], node_ids[target]) for source, target in zip(sources.tolist(), targets.tolist())]
     with open(filename, 'w') as file:
-        json.dump(graph, file, indent=4)
+        file.write('{\n')
+        if edge_data:
+            edge_labels, edge_label_names, directed, multigraph = edge_data
+            file.write(f'    "directed": {json.dumps(directed)},\n    "multigraph": {json.dumps(multigraph)},\n')
+            edge_label_names = [json.dumps(name) for name in edge_label_names]
+            edge_template = ('\n        {\n            "source": %s,\n            "target": %s,\n'
+                             '            "label": %s\n        }')
+            edges = [edge + (edge_label_names[label],) for edge, label in zip(edges, edge_labels.tolist())]
+        file.write('    "nodes": [')
+        _write_items(file, '\n        {\n            "id": %s,\n            "label": %s\n        }',
+                     list(zip(node_ids, [label_names[label] for label in graph.labels.tolist()])))
+        file.write('\n    ],\n    "edges": [')
+        _write_items(file, edge_template, edges)
+        file.write('\n    ]\n}\n')
+
+
+def save_graph(graph, filename):
+    if filename.endswith(EXTENSION):
+        save_binary_graph(graph, filename)
+    else:
+        save_graph_to_json(graph, filename)
+
+
+GENERATORS = {
+    'random': lambda num_nodes, seed: generate_random_graph(num_nodes, seed),
+    'erdos_renyi': lambda num_nodes, seed: erdos_renyi_graph(num_nodes, seed=seed),
+    'regular': lambda num_nodes, seed: random_regular_graph(num_nodes, seed=seed),
+    'power_law': lambda num_nodes, seed: power_law_graph(num_nodes, seed=seed),
+    'latin_square': lambda num_nodes, seed: latin_square_graph(max(1, int(round(num_nodes ** 0.5)))),
+    'cfi': lambda num_nodes, seed: cfi_pair(max(4, num_nodes // 20 * 2), seed=seed)[0],
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a random graph and optionally a twin of it.')
+    parser.add_argument('kind', choices=list(GENERATORS))
+    parser.add_argument('num_nodes', type=int)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--twin', choices=('isomorphic', 'non-isomorphic'))
+    parser.add_argument('--output', help=f'.json or {EXTENSION} file, rand_graph_<num_nodes>.json by default')
+    options = parser.parse_args(sys.argv[1:])
 
-num_nodes = 100000
-graph = generate_random_graph(num_nodes)
-filename = f"rand_graph_{num_nodes}.json"
-save_graph_to_json(graph, filename)
-print(f"Graph saved to {filename}")
+    rng = np.random.default_rng(options.seed)
+    filename = options.output or f"rand_graph_{options.num_nodes}.json"
+    if options.kind == 'cfi' and options.twin == 'non-isomorphic':
+        graph, twin = cfi_pair(max(4, options.num_nodes // 20 * 2), seed=rng)
+        twin = permuted_twin(twin, rng)
+    else:
+        graph = GENERATORS[options.kind](options.num_nodes, rng)
+        twin = None
+        if options.twin == 'isomorphic':
+            twin = permuted_twin(graph, rng)
+        elif options.twin == 'non-isomorphic':
+            twin = perturbed_twin(graph, rng, preserve_degrees=options.kind == 'regular')
+    save_graph(graph, filename)
+    print(f"Graph saved to {filename}")
+    if twin is not None:
+        base, extension = filename.rsplit('.', 1)
+        twin_filename = f"{base}_twin.{extension}"
+        save_graph(twin, twin_filename)
+        print(f"{options.twin.capitalize()} twin saved to {twin_filename}")
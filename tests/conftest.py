@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The algos and modules packages sit next to tests/ rather than on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
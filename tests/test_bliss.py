@@ -0,0 +1,19 @@
+from algos.bliss import CanonicalSearch, canonical_form
+from modules.generate_random_graph import perturbed_twin, permuted_twin, random_regular_graph
+
+
+def test_cubic_graph_prunes_children_mid_refinement():
+    # Every node of a random cubic graph is in the one root cell. Children
+    # whose refinement trace falls behind the best leaf's are abandoned
+    # instead of being refined to leaves, so only a handful are searched.
+    graph = random_regular_graph(800, 3, seed=0)
+    search = CanonicalSearch(graph).run()
+    assert search.search_nodes < 50
+    assert search.pruned > 700
+
+
+def test_cubic_graph_certificates():
+    graph = random_regular_graph(800, 3, seed=0)
+    certificate = canonical_form(graph)
+    assert canonical_form(permuted_twin(graph, seed=1)) == certificate
+    assert canonical_form(perturbed_twin(graph, seed=2, preserve_degrees=True)) != certificate
@@ -0,0 +1,102 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from algos.checkers import CHECKERS, MAPPINGS
+from algos.csr_graph import as_csr_graph
+from algos.mapping import verify_mapping
+from modules.generate_random_graph import (cfi_pair, latin_square_graph, permuted_twin, perturbed_twin,
+                                           random_regular_graph)
+
+
+# vf2 and bliss decide isomorphism exactly. The refinement and fingerprint
+# checkers may accept a non-isomorphic pair but never reject an isomorphic
+# one, and every *_mapping result is certified, so it is exact for all.
+EXACT = ('vf2', 'bliss')
+
+
+def _networkx_isomorphic(graph1, graph2):
+    return nx.is_isomorphic(graph1.to_networkx(), graph2.to_networkx(),
+                            node_match=lambda a, b: a['label'] == b['label'],
+                            edge_match=lambda a, b: a.get('label') == b.get('label'))
+
+
+def _random_pairs(count, seed=0):
+    # Labelled random graphs, every fourth one directed, each paired with a
+    # relabelled copy that has one edge toggled in every other pair
+    rng = np.random.default_rng(seed)
+    pairs = []
+    for index in range(count):
+        graph = nx.gnp_random_graph(int(rng.integers(4, 20)), float(rng.uniform(0.1, 0.5)),
+                                    seed=int(rng.integers(1 << 31)), directed=index % 4 == 3)
+        for node in graph:
+            graph.nodes[node]['label'] = f'L{int(rng.integers(2))}'
+        other = nx.relabel_nodes(graph, dict(zip(graph, rng.permutation(graph.number_of_nodes()).tolist())))
+        if index % 2:
+            source, target = rng.choice(other.number_of_nodes(), 2, replace=False).tolist()
+            if other.has_edge(source, target):
+                other.remove_edge(source, target)
+            else:
+                other.add_edge(source, target)
+        graph1, graph2 = as_csr_graph(graph), as_csr_graph(other)
+        pairs.append((graph1, graph2, _networkx_isomorphic(graph1, graph2)))
+    return pairs
+
+
+@pytest.fixture(scope='module')
+def random_pairs():
+    return _random_pairs(60)
+
+
+def _cfi_pairs():
+    graph, twisted = cfi_pair(20, seed=0)
+    return [(graph, permuted_twin(graph, seed=1), True), (graph, permuted_twin(twisted, seed=2), False)]
+
+
+def _strongly_regular_pairs():
+    cyclic = latin_square_graph(16, 'cyclic')
+    elementary = latin_square_graph(16, 'elementary_abelian')
+    return [(cyclic, permuted_twin(cyclic, seed=1), True), (cyclic, permuted_twin(elementary, seed=2), False)]
+
+
+def _regular_pairs():
+    graph = random_regular_graph(800, 3, seed=0)
+    return [(graph, permuted_twin(graph, seed=1), True),
+            (graph, perturbed_twin(graph, seed=2, preserve_degrees=True), False)]
+
+
+HARD_CASES = {'cfi': _cfi_pairs, 'strongly_regular': _strongly_regular_pairs, 'regular': _regular_pairs}
+
+
+@pytest.mark.parametrize('name', sorted(CHECKERS))
+def test_checkers_against_networkx(name, random_pairs):
+    for graph1, graph2, expected in random_pairs:
+        result = CHECKERS[name](graph1, graph2)
+        if name in EXACT:
+            assert result == expected
+        elif expected:
+            assert result
+
+
+@pytest.mark.parametrize('name', sorted(MAPPINGS))
+def test_mappings_are_verified(name, random_pairs):
+    for graph1, graph2, expected in random_pairs:
+        mapping = MAPPINGS[name](graph1, graph2)
+        assert (mapping is not None) == expected
+        if mapping is not None:
+            assert verify_mapping(graph1, graph2, mapping)
+
+
+@pytest.mark.parametrize('case', sorted(HARD_CASES))
+def test_hard_cases(case):
+    # The refinement checkers share one mapping function; each distinct
+    # function runs once
+    mappings = dict.fromkeys(MAPPINGS.values())
+    for graph1, graph2, expected in HARD_CASES[case]():
+        for name in EXACT:
+            assert CHECKERS[name](graph1, graph2) == expected
+        for function in mappings:
+            mapping = function(graph1, graph2)
+            assert (mapping is not None) == expected
+            if mapping is not None:
+                assert verify_mapping(graph1, graph2, mapping)
@@ -0,0 +1,16 @@
+import pytest
+
+from algos.mapping import lift_mapping, verify_mapping
+from modules.generate_random_graph import cfi_pair, permuted_twin
+
+
+@pytest.mark.parametrize('num_base', [20, 30])
+def test_cfi_pair_falls_back_to_canonical_labelings(num_base):
+    # Color refinement cannot tell a CFI pair apart and the backtracking
+    # has no automorphism pruning, so without its budget the non-isomorphic
+    # pair took exponential time
+    graph, twisted = cfi_pair(num_base, seed=num_base)
+    assert graph.num_nodes >= 200
+    assert lift_mapping(graph, permuted_twin(twisted, seed=1)) is None
+    twin = permuted_twin(graph, seed=2)
+    assert verify_mapping(graph, twin, lift_mapping(graph, twin))